@@ -1,3 +1,4 @@
+from benchkit.data.cache import ChunkCache  # noqa F401
 from benchkit.data.datasets import BaseFile  # noqa F401
 from benchkit.data.datasets import BooleanFile  # noqa F401
 from benchkit.data.datasets import JsonFile  # noqa F401
@@ -0,0 +1,102 @@
+import io
+import json
+import os
+import shutil
+import tarfile
+
+import numpy as np
+
+
+class ChunkArchive:
+    """
+    Reads the members of an uncompressed chunk tar in place. The offset and size of
+    every member are indexed from the tar headers once, members are then read or
+    memory mapped straight out of the archive without unpacking it.
+
+    :param path: the .tar chunk
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+        with tarfile.open(path, "r:") as tar:
+            self.members = {
+                os.path.normpath(member.name): (member.offset_data, member.size)
+                for member in tar.getmembers()
+                if member.isfile()
+            }
+
+    def __contains__(self, name: str) -> bool:
+        return os.path.normpath(name) in self.members
+
+    def _locate(self, name: str) -> tuple[int, int]:
+        try:
+            return self.members[os.path.normpath(name)]
+        except KeyError:
+            raise FileNotFoundError(f"{name} is not in {self.path}") from None
+
+    def read(self, name: str) -> bytes:
+        offset, size = self._locate(name)
+
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            return f.read(size)
+
+    def open(self, name: str) -> io.BytesIO:
+        return io.BytesIO(self.read(name))
+
+    def read_json(self, name: str):
+        return json.loads(self.read(name))
+
+    def map(self, name: str, mmap: bool = True) -> np.ndarray:
+        """
+        Exposes a member as a flat uint8 array
+
+        :param name: the member
+        :param mmap: memory map the member copy-on-write instead of reading it
+        :return: the member contents
+        """
+        offset, size = self._locate(name)
+
+        if not mmap:
+            return np.frombuffer(bytearray(self.read(name)), dtype=np.uint8)
+
+        # empty members cannot be memory mapped
+        if size == 0:
+            return np.empty(0, dtype=np.uint8)
+
+        return np.memmap(self.path, dtype=np.uint8, mode="c", offset=offset, shape=size)
+
+    def load_npy(self, name: str, mmap: bool = True) -> np.ndarray:
+        """
+        Loads a .npy member, the data after the header is memory mapped when mmap is set
+        """
+        offset, _ = self._locate(name)
+
+        if not mmap:
+            return np.load(self.open(name))
+
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            if np.lib.format.read_magic(f) == (1, 0):
+                header = np.lib.format.read_array_header_1_0(f)
+            else:
+                header = np.lib.format.read_array_header_2_0(f)
+            data_offset = f.tell()
+
+        shape, fortran_order, dtype = header
+
+        if int(np.prod(shape, dtype=int)) == 0:
+            return np.empty(shape, dtype=dtype)
+
+        return np.memmap(
+            self.path,
+            dtype=dtype,
+            mode="c",
+            offset=data_offset,
+            shape=shape,
+            order="F" if fortran_order else "C",
+        )
+
+    def extract(self, directory: str):
+        shutil.unpack_archive(self.path, directory, "tar")
@@ -0,0 +1,180 @@
+import contextlib
+import json
+import os
+import shutil
+
+from filelock import FileLock
+
+try:
+    import fcntl
+except ImportError:  # not available on windows
+    fcntl = None
+
+
+def _folder_size(path: str) -> int:
+    return sum(
+        os.path.getsize(os.path.join(root, name))
+        for root, _, files in os.walk(path)
+        for name in files
+    )
+
+
+class ChunkCache:
+    """
+    Keeps downloaded chunks on local disk across epochs, evicting the least recently
+    used ones once the cache grows past its byte budget. The cache can be shared by
+    every DataLoader worker on a host, the index of entries is guarded by a file lock
+    and each entry is filled under a lock of its own, so a chunk is downloaded once
+    even when several workers ask for it together.
+
+    Entries being read are pinned and never evicted, so the cache may briefly hold
+    more than its budget while the chunks in use do not fit in it. A pin is a shared
+    flock on the pin file of the entry, the lock goes away with the process holding
+    it however it exits, and whatever PID namespace it runs in. Where flock is not
+    available only the pins of the current process are seen.
+
+    :param directory: where the cached chunks are kept
+    :param max_bytes: the byte budget of the cache
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        # the open pin files of this process, by entry key
+        self._pins = {}
+
+        os.makedirs(directory, exist_ok=True)
+
+    def __getstate__(self):
+        # pins belong to the process that took them
+        state = self.__dict__.copy()
+        state["_pins"] = {}
+        return state
+
+    @staticmethod
+    def key(chunk: dict) -> str:
+        """
+        :param chunk: a chunk dict returned by get_ds_chunks
+        :return: the cache key of the chunk, its id and content hash. Chunks uploaded
+            without a content hash fall back to their byte size
+        """
+        return f"{chunk['id']}-{chunk.get('content_hash') or chunk['size']}"
+
+    def entry_path(self, key: str) -> str:
+        return os.path.join(self.directory, key)
+
+    @contextlib.contextmanager
+    def _index(self):
+        index_path = os.path.join(self.directory, "index.json")
+
+        with FileLock(os.path.join(self.directory, "index.lock")):
+            index = {"clock": 0, "entries": {}}
+            if os.path.isfile(index_path):
+                with open(index_path) as f:
+                    index = json.load(f)
+
+            yield index
+
+            with open(index_path + ".tmp", "w") as f:
+                json.dump(index, f, indent=2)
+
+            os.replace(index_path + ".tmp", index_path)
+
+    @staticmethod
+    def _touch(index: dict, key: str):
+        index["clock"] += 1
+        index["entries"][key]["used"] = index["clock"]
+
+    def _pin(self, key: str):
+        fd = os.open(self.entry_path(key) + ".pin", os.O_RDWR | os.O_CREAT)
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_SH)
+
+        self._pins.setdefault(key, []).append(fd)
+
+    def _pinned(self, key: str) -> bool:
+        if self._pins.get(key):
+            return True
+
+        if fcntl is None:
+            return False
+
+        fd = os.open(self.entry_path(key) + ".pin", os.O_RDWR | os.O_CREAT)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return True
+        finally:
+            os.close(fd)
+
+        return False
+
+    def _evict(self, index: dict):
+        entries = index["entries"]
+        total = sum(entry["size"] for entry in entries.values())
+
+        # pins are only taken under the index lock, so an entry found unpinned here
+        # stays unpinned until it is removed
+        for key in sorted(entries, key=lambda x: entries[x]["used"]):
+            if total <= self.max_bytes:
+                break
+
+            if self._pinned(key):
+                continue
+
+            shutil.rmtree(self.entry_path(key), ignore_errors=True)
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(self.entry_path(key) + ".pin")
+
+            total -= entries[key]["size"]
+            del entries[key]
+
+    def acquire(self, key: str, fill) -> str:
+        """
+        Pins an entry, filling it first if it is not cached
+
+        :param key: the key of the entry
+        :param fill: called with an empty folder to write the entry into
+        :return: the folder of the entry, valid until the entry is released
+        """
+        path = self.entry_path(key)
+
+        with FileLock(path + ".lock"):
+            with self._index() as index:
+                if key in index["entries"] and os.path.isdir(path):
+                    self._touch(index, key)
+                    self._pin(key)
+                    return path
+
+            # a fill interrupted before it was moved into place leaves a tmp folder
+            shutil.rmtree(path + ".tmp", ignore_errors=True)
+            shutil.rmtree(path, ignore_errors=True)
+            os.mkdir(path + ".tmp")
+
+            fill(path + ".tmp")
+            os.replace(path + ".tmp", path)
+
+            with self._index() as index:
+                index["entries"][key] = {"size": _folder_size(path)}
+                self._touch(index, key)
+                self._pin(key)
+                self._evict(index)
+
+        return path
+
+    def release(self, key: str):
+        """
+        Unpins an entry, letting it be evicted again
+        """
+        with self._index() as index:
+            if self._pins.get(key):
+                os.close(self._pins[key].pop())
+
+            self._evict(index)
+
+    def size(self) -> int:
+        """
+        :return: the bytes held by the cached entries
+        """
+        with self._index() as index:
+            return sum(entry["size"] for entry in index["entries"].values())
@@ -1,9 +1,13 @@
+import collections
+import hashlib
+import itertools
 import json
 import math
 import os
 import shutil
 import uuid
 import warnings
+from concurrent.futures import ThreadPoolExecutor
 from typing import final
 
 import numpy as np
@@ -11,6 +15,7 @@ import requests
 import torch
 from torch.utils.data import IterableDataset
 
+from benchkit.data.archive import ChunkArchive
 from benchkit.data.file_saver import BaseFile
 from benchkit.data.file_saver import BooleanFile
 from benchkit.data.file_saver import JsonFile
@@ -19,14 +24,25 @@ from benchkit.data.file_saver import NumpyFile
 from benchkit.data.file_saver import RawFile
 from benchkit.data.file_saver import TextFile
 from benchkit.data.file_saver import TorchFile
+from benchkit.data.manifest import balanced_split
+from benchkit.data.manifest import ChunkIndex
+from benchkit.data.manifest import slice_pieces
+from benchkit.data.permutation import IndexPermutation
+from benchkit.data.permutation import make_order
 from benchkit.misc.requests.dataset import get_current_dataset
 from benchkit.misc.requests.dataset import get_ds_chunks
 from benchkit.misc.requests.dataset import get_get_url
 
 
 class ProcessorDataset:
+    orderings = ("sequential", "block", "shuffle")
+
     def __init__(self):
         self._prefix = None
+        self._batch_size = 1
+        self._ordering = "shuffle"
+        self._seed = None
+        self._block_size = 1024
 
     def _get_savers(self) -> tuple[BaseFile, ...] | BaseFile:
         raise NotImplementedError(
@@ -56,6 +72,26 @@ class ProcessorDataset:
         for i in self._check_savers():
             i.reset()
 
+    def close_savers(self):
+        for i in self._check_savers():
+            i.close()
+
+    def saver_usage(self) -> tuple[int, int] | None:
+        """
+        :return: how many bytes and files the savers take up in the current chunk, or
+            None when one of the savers does not keep count
+        """
+        nbytes = file_count = 0
+
+        for i in self._check_savers():
+            if i.nbytes is None or i.file_count is None:
+                return None
+
+            nbytes += i.nbytes
+            file_count += i.file_count
+
+        return nbytes, file_count
+
     @property
     def prefix(self):
         return self._prefix
@@ -69,18 +105,78 @@ class ProcessorDataset:
             "Subclasses of ProcessorDataset should implement __len__."
         )
 
+    @property
+    def batch_size(self) -> int:
+        """
+        How many samples builds hand to `_get_batch` at once, batches are shrunk near
+        the end of a chunk so chunks are still cut at their size limit
+        """
+        return getattr(self, "_batch_size", 1)
+
+    @batch_size.setter
+    def batch_size(self, batch_size: int):
+        if batch_size < 1:
+            raise ValueError("batch_size must be at least 1")
+        self._batch_size = batch_size
+
+    @property
+    def ordering(self) -> str:
+        """
+        The order samples are processed in:
+
+        - sequential: by index, reading the sources of the dataset front to back
+        - block: blocks of `block_size` indices in shuffled order, sequential within
+          a block
+        - shuffle: fully shuffled
+        """
+        return getattr(self, "_ordering", "shuffle")
+
+    @ordering.setter
+    def ordering(self, ordering: str):
+        if ordering not in self.orderings:
+            raise ValueError(f"ordering must be one of {self.orderings}")
+        self._ordering = ordering
+
+    @property
+    def seed(self) -> int | None:
+        """
+        Seeds the block and shuffle orderings, None picks a random order every time.
+        Builds derive a seed from the dataset name instead, so rebuilds stay the same
+        """
+        return getattr(self, "_seed", None)
+
+    @seed.setter
+    def seed(self, seed: int | None):
+        self._seed = seed
+
+    @property
+    def block_size(self) -> int:
+        return getattr(self, "_block_size", 1024)
+
+    @block_size.setter
+    def block_size(self, block_size: int):
+        if block_size < 1:
+            raise ValueError("block_size must be at least 1")
+        self._block_size = block_size
+
+    def order(
+        self, start: int = 0, stop: int | None = None
+    ) -> range | IndexPermutation:
+        """
+        :param start: the first index to order
+        :param stop: the index to stop before, defaults to the length of the dataset
+        :return: the indices from start to stop in the order they are processed, as a
+            lazy sequence that takes constant memory
+        """
+        stop = len(self) if stop is None else stop
+        return make_order(self.ordering, start, stop, self.seed, self.block_size)
+
     def __iter__(self):
-        self._len_list = np.arange(len(self), dtype=int)
-        np.random.shuffle(self._len_list)
-        self._pos = 0
+        self._iterator = iter(self.order())
         return self
 
     def __next__(self):
-        if self._pos >= len(self):
-            raise StopIteration
-
-        self._pos += 1
-        return self[self._len_list[self._pos - 1]]
+        return self[next(self._iterator)]
 
     @final
     def __getitem__(self, idx):
@@ -91,18 +187,76 @@ class ProcessorDataset:
             "Subclasses of ProcessorDataset should implement _get_data."
         )
 
+    @final
+    def get_batch(self, indices: list[int]):
+        self._get_batch(indices)
+
+    def _get_batch(self, indices: list[int]):
+        """
+        Processes several samples at once, override it to process them vectorized and
+        hand them to the savers with `append_batch`
+
+        :param indices: the indices of the samples, in processing order
+        """
+        for idx in indices:
+            self._get_data(idx)
+
+
+# saver tags that can be read out of an uncompressed chunk without unpacking it
+_IN_PLACE_TAGS = {
+    "textfile",
+    "bool",
+    "arr",
+    "enforced_arr",
+    "json",
+    "ten",
+    "num",
+    "blob",
+}
+
 
 class IterableChunk(IterableDataset):
+    # range splits the samples evenly among DataLoader workers, samples and bytes hand
+    # each worker whole chunks, balancing the samples or bytes of the chunks, and fall
+    # back to range when there are fewer chunks than workers
+    shardings = ("range", "samples", "bytes")
+
     def __init__(self):
         self._cloud = None
         self._name = None
         self.chunk_list = None
+        self.chunk_index = None
         self._dataset_id = None
         self.end_index = None
         self.start_index = None
         self.init_start_index = 0
         self._file_converters = []
         self.length = None
+        # chunk files that support it are memory mapped instead of read into memory
+        self.mmap = True
+        # packed RawFiles hand out file paths instead of bytes when this is set
+        self.materialize = False
+        self._archive = None
+        # how many upcoming chunks are fetched in the background, 0 fetches each chunk
+        # only once the previous one is read
+        self.prefetch = 1
+        # a ChunkCache keeping downloaded chunks across epochs, None downloads every
+        # chunk again each epoch
+        self.cache = None
+        # how the samples are split among DataLoader workers, one of shardings
+        self.sharding = "range"
+        self._worker = None
+        # shuffles the chunk order every epoch, and draws samples at random from
+        # shuffle_chunks open chunks at once
+        self.shuffle = False
+        self.shuffle_chunks = 4
+        # seeds the chunk order, None derives the seed from the dataset so every rank
+        # and DataLoader worker draws the same order without sharing a seed
+        self.seed = None
+        self.epoch = 0
+        # the process of a distributed run this iterator reads for, see set_rank
+        self.rank = 0
+        self.num_ranks = 1
 
     def post_init(self, name, cloud):
         self._cloud = cloud
@@ -116,9 +270,13 @@ class IterableChunk(IterableDataset):
         self._dataset_id = dataset["id"]
         self.end_index = dataset["sample_count"]
         self.length = dataset["sample_count"]
+        self.chunk_index = self._load_chunk_index()
 
     def __len__(self):
         # possibly dangerous
+        if self.num_ranks > 1:
+            return self.length // self.num_ranks
+
         return self.length
 
     def test_init(self, name: str, length: int):
@@ -129,6 +287,7 @@ class IterableChunk(IterableDataset):
         self._cloud = False
         self._name = name
         self.end_index = length
+        self.chunk_index = self._load_chunk_index()
 
     @staticmethod
     def delete_dir(uid: str):
@@ -141,7 +300,41 @@ class IterableChunk(IterableDataset):
         if os.path.isdir(zip_dir):
             shutil.rmtree(zip_dir)
 
-    def unzip_local_data(self, current_file: str):
+    def _in_place_archive(self, chunk_path: str) -> ChunkArchive | None:
+        """
+        Indexes an uncompressed chunk so it can be read straight out of its archive.
+        Chunks holding folder RawFiles, or packed RawFiles that are materialized, still
+        have to be unpacked.
+
+        :param chunk_path: the downloaded or local chunk
+        :return: the indexed archive, None if the chunk has to be unpacked
+        """
+        if not chunk_path.endswith(".tar"):
+            return None
+
+        archive = ChunkArchive(chunk_path)
+        tags = {tag for _, tag in archive.read_json("ann.json")}
+
+        # savers of subclasses only know how to load from unpacked files
+        readable = _IN_PLACE_TAGS - ({"blob"} if self.materialize else set())
+        if not tags <= readable:
+            return None
+
+        return archive
+
+    def _fetch_local(self, current_file: str) -> tuple[str | ChunkArchive, str | None]:
+        """
+        Readies a local chunk for reading without touching the loaded savers, so it
+        can run on the prefetch thread
+
+        :param current_file: the chunk
+        :return: the archive or unpacked folder to load the savers from, and the
+            temporary folder to delete once the chunk is read
+        """
+        archive = self._in_place_archive(current_file)
+        if archive:
+            return archive, None
+
         f_id = f"Temp-{str(uuid.uuid4())}"
         root_dir = os.path.join("", f_id)
 
@@ -150,27 +343,38 @@ class IterableChunk(IterableDataset):
 
         os.mkdir(root_dir)
         chunk_path = os.path.join(
-            root_dir, os.path.split(current_file)[-1][: -len(".tar.gz")]
+            root_dir, os.path.split(current_file)[-1].split(".")[0]
         )
 
         shutil.unpack_archive(current_file, chunk_path)
 
-        self.file_converters = chunk_path
-
         return chunk_path, f_id
 
-    def unzip_cloud_data(self, chunk_id: str, current_file: str):
+    @staticmethod
+    def _download(chunk_id: str, zip_path: str):
         download_url = get_get_url(chunk_id)
 
+        # the chunk is streamed to disk so only a block of it is held in memory
+        # TODO: Consider adding a timeout here. Ignoring bugbear issue for now ...
+        with requests.get(download_url, stream=True) as response:  # noqa S113
+            response.raise_for_status()
+
+            with open(zip_path, "wb") as f:
+                for block in response.iter_content(chunk_size=1_024**2):
+                    f.write(block)
+
+    def _fetch_cloud(
+        self, chunk_id: str, current_file: str
+    ) -> tuple[str | ChunkArchive, str]:
+        """
+        Downloads a chunk and readies it for reading, see _fetch_local
+        """
         f_id = f"Temp-{str(uuid.uuid4())}"
         root_dir = os.path.join("", f_id)
 
         if os.path.isdir(root_dir):
             shutil.rmtree(root_dir)
 
-        # TODO: Consider adding a timeout here. Ignoring bugbear issue for now ...
-        mem_zip = requests.get(download_url)  # noqa S113
-
         zip_dir = os.path.join("", f"Temp-zip-{f_id}")
         if os.path.isdir(zip_dir):
             shutil.rmtree(zip_dir)
@@ -178,11 +382,14 @@ class IterableChunk(IterableDataset):
         os.mkdir(zip_dir)
         zip_path = os.path.join(zip_dir, os.path.split(current_file)[-1])
 
-        with open(zip_path, "wb") as f:
-            f.write(mem_zip.content)
+        self._download(chunk_id, zip_path)
+
+        archive = self._in_place_archive(zip_path)
+        if archive:
+            return archive, f_id
 
         chunk_path = os.path.join(
-            root_dir, os.path.split(current_file)[-1][: -len(".tar.gz")]
+            root_dir, os.path.split(current_file)[-1].split(".")[0]
         )
 
         try:
@@ -190,28 +397,102 @@ class IterableChunk(IterableDataset):
         except FileExistsError:
             pass
 
-        self.file_converters = chunk_path
-
         return chunk_path, f_id
 
+    def _fetch_cached(self, chunk: dict) -> tuple[str | ChunkArchive, str]:
+        """
+        Reads a chunk through the chunk cache, it is only downloaded when it is not
+        cached yet. Chunks that cannot be read in place are cached unpacked.
+
+        :param chunk: a chunk dict returned by get_ds_chunks
+        :return: the archive or unpacked folder to load the savers from, and the cache
+            key to release once the chunk is read
+        """
+        file_name = os.path.split(chunk["location"])[-1]
+        folder_name = file_name.split(".")[0]
+
+        def fill(directory: str):
+            zip_path = os.path.join(directory, file_name)
+            self._download(chunk["id"], zip_path)
+
+            if self._in_place_archive(zip_path) is None:
+                shutil.unpack_archive(zip_path, os.path.join(directory, folder_name))
+                os.remove(zip_path)
+
+        key = self.cache.key(chunk)
+        entry = self.cache.acquire(key, fill)
+
+        zip_path = os.path.join(entry, file_name)
+        if not os.path.isfile(zip_path):
+            return os.path.join(entry, folder_name), key
+
+        archive = self._in_place_archive(zip_path)
+        if archive:
+            return archive, key
+
+        # cached to be read in place before materialize was set
+        try:
+            return self._fetch_local(zip_path)
+        finally:
+            self.cache.release(key)
+
+    def _fetch_chunk(self, chunk: str | dict) -> tuple[str | ChunkArchive, str | None]:
+        if self._cloud and self.cache is not None:
+            return self._fetch_cached(chunk)
+
+        if self._cloud:
+            return self._fetch_cloud(chunk["id"], chunk["location"])
+
+        return self._fetch_local(chunk)
+
+    def _release_chunk(self, f_id: str):
+        # chunks read through the cache are pinned under their key instead of being
+        # unpacked to a temporary folder
+        if f_id.startswith("Temp-"):
+            self.delete_dir(f_id)
+        else:
+            self.cache.release(f_id)
+
+    def unzip_local_data(self, current_file: str):
+        source, f_id = self._fetch_local(current_file)
+        self.file_converters = source
+
+        return (source.path if isinstance(source, ChunkArchive) else source), f_id
+
+    def unzip_cloud_data(self, chunk_id: str, current_file: str):
+        source, f_id = self._fetch_cloud(chunk_id, current_file)
+        self.file_converters = source
+
+        return (source.path if isinstance(source, ChunkArchive) else source), f_id
+
     def file_converter(self, tag: str, file_path: str) -> BaseFile:
+        # set while the savers of a chunk are read straight out of its archive
+        archive = self._archive
+
         match tag:
             case "textfile":
-                return TextFile.load(file_path)
+                return TextFile.load(file_path, mmap=self.mmap, archive=archive)
             case "bool":
-                return BooleanFile.load(file_path)
+                return BooleanFile.load(file_path, mmap=self.mmap, archive=archive)
             case "arr":
-                return NumpyFile.load(file_path, False)
+                return NumpyFile.load(file_path, False, mmap=self.mmap, archive=archive)
             case "enforced_arr":
-                return NumpyFile.load(file_path, True)
+                return NumpyFile.load(file_path, True, mmap=self.mmap, archive=archive)
             case "json":
-                return JsonFile.load(file_path)
+                return JsonFile.load(file_path, mmap=self.mmap, archive=archive)
             case "ten":
-                return TorchFile.load(file_path)
+                return TorchFile.load(file_path, mmap=self.mmap, archive=archive)
             case "num":
-                return NumericFile.load(file_path)
+                return NumericFile.load(file_path, mmap=self.mmap, archive=archive)
             case "folder":
                 return RawFile.load(file_path)
+            case "blob":
+                return RawFile.load(
+                    file_path,
+                    mmap=self.mmap,
+                    materialize=self.materialize,
+                    archive=archive,
+                )
             case _:
                 raise ModuleNotFoundError(f"tag: {tag} is not a valid tag")
 
@@ -220,7 +501,20 @@ class IterableChunk(IterableDataset):
         return self._file_converters
 
     @file_converters.setter
-    def file_converters(self, folder_path: str):
+    def file_converters(self, folder_path: str | ChunkArchive):
+        if isinstance(folder_path, ChunkArchive):
+            self._archive = folder_path
+
+            try:
+                self._file_converters = [
+                    self.file_converter(tag, name)
+                    for name, tag in folder_path.read_json("ann.json")
+                ]
+            finally:
+                self._archive = None
+
+            return
+
         order_list = []
         with open(os.path.join(folder_path, "ann.json")) as f:
             order_list.extend(json.load(f))
@@ -239,59 +533,253 @@ class IterableChunk(IterableDataset):
             else self.file_converters[0](idx)
         )
 
-    def _data_iterator(self):
-        current_count = 0
-        previous_count = 0
-        current_folder = None
-
-        while self.start_index < self.end_index:
-            while current_count <= self.start_index:
-                current_file = self.chunk_list.pop(0)
-                previous_count = current_count
-
-                if self._cloud:
-                    current_count += current_file["file_count"]
-                else:
-                    current_count += int(
-                        os.path.split(current_file)[-1].split("-")[2][: -len(".tar.gz")]
-                    )
-
-                if current_count > self.start_index:
-                    if self._cloud:
-                        _, folder = self.unzip_cloud_data(
-                            current_file["id"], current_file["location"]
-                        )
+    def _fetched_chunks(self, positions: list[int]):
+        """
+        Yields the chunks at the given positions readied for reading, together with
+        their temporary folder. Up to `prefetch` chunks after the ones being read are
+        downloaded and unpacked on a background thread.
+
+        :param positions: the positions of the chunks in the chunk index
+        """
+        chunks = self.chunk_index.chunks
+
+        if not self.prefetch:
+            for position in positions:
+                yield self._fetch_chunk(chunks[position])
+            return
+
+        positions = iter(positions)
+        pending = collections.deque()
+        executor = ThreadPoolExecutor(1, thread_name_prefix="chunk-prefetch")
+
+        try:
+            while True:
+                # the chunk about to be read, and the ones after it
+                for position in itertools.islice(
+                    positions, self.prefetch + 1 - len(pending)
+                ):
+                    pending.append(executor.submit(self._fetch_chunk, chunks[position]))
+
+                if not pending:
+                    break
+
+                yield pending.popleft().result()
+        finally:
+            # the iterator was stopped early, drop the chunks fetched ahead of it
+            executor.shutdown(cancel_futures=True)
+
+            for future in pending:
+                if future.cancelled() or future.exception():
+                    continue
+
+                _, folder = future.result()
+                if folder:
+                    self._release_chunk(folder)
+
+    def _epoch_rng(self, epoch: int) -> np.random.Generator:
+        seed = self.seed
+        if seed is None:
+            dataset = str(self._dataset_id if self._cloud else self._name)
+            digest = hashlib.blake2b(dataset.encode(), digest_size=8).digest()
+            seed = int.from_bytes(digest, "little")
+
+        return np.random.default_rng((seed, epoch))
+
+    def _shard_pieces(self, epoch: int) -> list[tuple[int, int, int]]:
+        """
+        Lists the chunks this iterator reads this epoch, see ChunkIndex.pieces. The
+        chunk order is shuffled before the chunks are split among the DataLoader
+        workers and ranks, every one of them draws the same order from the seed.
+        """
+        pieces = self.chunk_index.pieces(self.init_start_index, self.end_index)
+
+        if self.shuffle:
+            order = self._epoch_rng(epoch).permutation(len(pieces))
+            pieces = [pieces[i] for i in order]
+
+        if self.num_ranks > 1:
+            return self._rank_pieces(pieces)
+
+        if self._worker is not None:
+            worker_id, num_workers = self._worker
+
+            if len(pieces) < num_workers:
+                total = sum(stop - start for _, start, stop in pieces)
+                per_worker, extra = divmod(total, num_workers)
+                start = worker_id * per_worker + min(worker_id, extra)
+
+                return slice_pieces(
+                    pieces, start, start + per_worker + (worker_id < extra)
+                )
+
+            cuts = balanced_split(
+                [self.chunk_index.weight(piece, self.sharding) for piece in pieces],
+                num_workers,
+            )
+            pieces = pieces[cuts[worker_id] : cuts[worker_id + 1]]
+
+        return pieces
+
+    def _rank_pieces(
+        self, pieces: list[tuple[int, int, int]]
+    ) -> list[tuple[int, int, int]]:
+        """
+        Shares the pieces out among the ranks, and then among the DataLoader workers of
+        a rank. Every rank reads the same number of samples, the samples left over are
+        dropped, and a worker reads as many samples as the same worker of every other
+        rank, so all ranks batch the same number of times. Ranks are cut at sample
+        offsets, unless the sharding is range workers keep the whole chunks
+        balanced_split hands them while they fit and only the chunks that overflow a
+        worker are cut to even out the rest.
+        """
+        total = sum(stop - start for _, start, stop in pieces)
+        per_rank = total // self.num_ranks
+        pieces = slice_pieces(pieces, self.rank * per_rank, (self.rank + 1) * per_rank)
+
+        if self._worker is None:
+            return pieces
+
+        worker_id, num_workers = self._worker
+        per_worker, extra = divmod(per_rank, num_workers)
+        needs = [per_worker + (i < extra) for i in range(num_workers)]
+        shares = [[] for _ in range(num_workers)]
+        overflow = pieces
+
+        if self.sharding != "range" and len(pieces) >= num_workers:
+            cuts = balanced_split(
+                [self.chunk_index.weight(piece, self.sharding) for piece in pieces],
+                num_workers,
+            )
+            overflow = []
+
+            for i in range(num_workers):
+                for piece in pieces[cuts[i] : cuts[i + 1]]:
+                    count = piece[2] - piece[1]
+
+                    if count <= needs[i]:
+                        shares[i].append(piece)
+                        needs[i] -= count
                     else:
-                        _, folder = self.unzip_local_data(current_file)
+                        overflow.append(piece)
 
-                    if current_folder:
-                        self.delete_dir(current_folder)
+        start = sum(needs[:worker_id])
+        return shares[worker_id] + slice_pieces(
+            overflow, start, start + needs[worker_id]
+        )
 
-                    current_folder = folder
+    def _open_chunk(self, piece: tuple[int, int, int], source, rng) -> tuple:
+        self.file_converters = source
 
-            index = self.start_index - previous_count
+        position, start, stop = piece
+        chunk_start, _ = self.chunk_index.sample_range(position)
 
-            yield self.unpack_data(index)
+        # rows are popped off the end
+        rows = range(stop - 1 - chunk_start, start - 1 - chunk_start, -1)
+        if rng is not None:
+            rows = rng.permutation(rows).tolist()
 
-            self.start_index += 1
+        return self._file_converters, list(rows)
 
-        self.delete_dir(current_folder)
+    @staticmethod
+    def _draw(open_chunks: list, rng) -> int:
+        # the odds of drawing from a chunk follow the rows it has left, which reads
+        # the rows of all open chunks in a uniformly shuffled order
+        if len(open_chunks) == 1:
+            return 0
+
+        drawn = rng.integers(sum(len(rows) for _, rows, _ in open_chunks))
+
+        for i, (_, rows, _) in enumerate(open_chunks):
+            if drawn < len(rows):
+                return i
+            drawn -= len(rows)
+
+    def _data_iterator(self, epoch: int):
+        pieces = self._shard_pieces(epoch)
+        fetched = self._fetched_chunks([position for position, _, _ in pieces])
+        pieces = iter(pieces)
+
+        # samples are drawn at random from the rows left in several open chunks when
+        # shuffling, open chunks are memory mapped so only their rows are held
+        rng = self._epoch_rng(epoch) if self.shuffle else None
+        width = self.shuffle_chunks if self.shuffle else 1
+        open_chunks = []
+
+        try:
+            while True:
+                for piece in itertools.islice(pieces, width - len(open_chunks)):
+                    source, folder = next(fetched)
+                    open_chunks.append((*self._open_chunk(piece, source, rng), folder))
+
+                if not open_chunks:
+                    break
+
+                i = self._draw(open_chunks, rng)
+                converters, rows, folder = open_chunks[i]
+
+                self._file_converters = converters
+                yield self.unpack_data(rows.pop())
+
+                self.start_index += 1
+
+                if not rows:
+                    del open_chunks[i]
+                    if folder:
+                        self._release_chunk(folder)
+        finally:
+            fetched.close()
+
+            for _, _, folder in open_chunks:
+                if folder:
+                    self._release_chunk(folder)
+
+    def _load_chunk_index(self) -> ChunkIndex:
+        if not self._cloud:
+            return ChunkIndex.from_folder(os.path.join("ProjectDatasets", self._name))
+
+        return ChunkIndex.from_cloud(get_ds_chunks(self._dataset_id))
 
     def __iter__(self):
         self.start_index = self.init_start_index
 
-        if not self._cloud:
-            data_path = os.path.join("ProjectDatasets", self._name)
-            data_list = [i for i in os.listdir(data_path) if i.endswith(".tar.gz")]
-            self.chunk_list = [os.path.join(data_path, chunk) for chunk in data_list]
-            self.chunk_list = sorted(
-                self.chunk_list, key=lambda x: int(os.path.split(x)[-1].split("-")[1])
-            )
-        else:
-            self.chunk_list = get_ds_chunks(self._dataset_id)
-            self.chunk_list = sorted(self.chunk_list, key=lambda x: x["number"])
+        # the index is loaded once by post_init, DataLoader workers receive a copy
+        if self.chunk_index is None:
+            self.chunk_index = self._load_chunk_index()
+
+        self.chunk_list = self.chunk_index.chunks
+
+        # iterating again in the same process draws the order of the next epoch
+        epoch = self.epoch
+        self.epoch += 1
+
+        return iter(self._data_iterator(epoch))
+
+    def set_rank(self, rank: int, num_ranks: int):
+        """
+        Shards the dataset among the processes of a distributed run, every process
+        reads an even share of the samples straight from the chunks. Pass the
+        process_index and num_processes of an Accelerator.
 
-        return iter(self._data_iterator())
+        :param rank: the index of this process
+        :param num_ranks: how many processes read the dataset
+        """
+        if not 0 <= rank < num_ranks:
+            raise ValueError(f"rank {rank} is not one of {num_ranks} ranks")
+
+        self.rank = rank
+        self.num_ranks = num_ranks
+
+    def set_epoch(self, epoch: int):
+        """
+        Sets the epoch the chunk order and shuffle draws are seeded with, the epoch
+        advances by itself every time the dataset is iterated. DataLoader workers get a
+        fresh copy of the dataset every epoch unless they are persistent, as they are
+        with get_dataloader, so with other loaders the epoch should be set before each
+        epoch like a DistributedSampler
+
+        :param epoch: the epoch about to be iterated
+        """
+        self.epoch = epoch
 
     @staticmethod
     def worker_init_fn(worker_id):
@@ -300,6 +788,15 @@ class IterableChunk(IterableDataset):
         overall_start = dataset.init_start_index
         overall_end = dataset.end_index
 
+        if dataset.sharding not in IterableChunk.shardings:
+            raise ValueError(f"Unknown sharding {dataset.sharding}")
+
+        # chunks are shared out once their order for the epoch is drawn, ranks are
+        # always sharded before the workers within them
+        if dataset.sharding != "range" or dataset.num_ranks > 1:
+            dataset._worker = (worker_id, worker_info.num_workers)
+            return
+
         per_worker = int(
             math.ceil((overall_end - overall_start) / float(worker_info.num_workers))
         )
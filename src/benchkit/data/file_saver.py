@@ -1,20 +1,237 @@
+import array
+import hashlib
 import json
 import os
 import pickle  # noqa S403
 import shutil
+import struct
+import threading
 import uuid
 import warnings
+from concurrent.futures import ThreadPoolExecutor
 
 import numpy as np
 import torch
 
+from benchkit.data.archive import ChunkArchive
+
+try:
+    import fcntl
+except ImportError:  # not available on windows
+    fcntl = None
+
+# ioctl request that clones (reflinks) a whole file on btrfs, xfs and friends
+_FICLONE = 0x40049409
+
+# bytes reserved for the header of .npy files that are written incrementally
+_NPY_HEADER_SIZE = 256
+
+# np.save pads the header of the int64 index files to this many bytes
+_INDEX_HEADER_SIZE = 128
+
+
+def _map_bytes(
+    path: str, mmap: bool = True, archive: ChunkArchive | None = None
+) -> np.ndarray:
+    """
+    Exposes a file as a flat uint8 array
+
+    :param path: the file to read
+    :param mmap: when True the file is memory mapped copy-on-write, so reads are lazy
+        and the returned array is still writable for consumers such as torch
+    :param archive: the chunk archive the file is a member of, if it is not unpacked
+    :return: the file contents
+    """
+    if archive is not None:
+        return archive.map(path, mmap=mmap)
+
+    if not mmap:
+        return np.fromfile(path, dtype=np.uint8)
+
+    # empty files cannot be memory mapped
+    if os.path.getsize(path) == 0:
+        return np.empty(0, dtype=np.uint8)
+
+    return np.memmap(path, dtype=np.uint8, mode="c")
+
+
+def _load_npy(
+    path: str, mmap: bool = False, archive: ChunkArchive | None = None
+) -> np.ndarray:
+    if archive is not None:
+        return archive.load_npy(path, mmap=mmap)
+
+    return np.load(path, mmap_mode="c" if mmap else None)
+
+
+def _read_json(path: str, archive: ChunkArchive | None = None):
+    if archive is not None:
+        return archive.read_json(path)
+
+    with open(path) as file:
+        return json.load(file)
+
+
+def _isfile(path: str, archive: ChunkArchive | None = None) -> bool:
+    return path in archive if archive is not None else os.path.isfile(path)
+
+
+def _file_digest(path: str) -> str:
+    digest = hashlib.blake2b()
+
+    with open(path, "rb") as file:
+        while block := file.read(1_024**2):
+            digest.update(block)
+
+    return digest.hexdigest()
+
+
+def _kernel_copy(f_src, f_dst) -> bool:
+    """
+    Copies an open file without moving its bytes through user space, either as a
+    reflink (copy on write clone) or with copy_file_range
+
+    :return: whether the copy succeeded, f_dst is left empty when it did not
+    """
+    if fcntl is not None:
+        try:
+            fcntl.ioctl(f_dst.fileno(), _FICLONE, f_src.fileno())
+            return True
+        except OSError:
+            pass
+
+    if not hasattr(os, "copy_file_range"):
+        return False
+
+    try:
+        remaining = os.fstat(f_src.fileno()).st_size
+        while remaining > 0:
+            copied = os.copy_file_range(f_src.fileno(), f_dst.fileno(), remaining)
+            if copied == 0:
+                break
+            remaining -= copied
+        else:
+            return True
+    except OSError:
+        pass
+
+    f_src.seek(0)
+    f_dst.seek(0)
+    f_dst.truncate()
+
+    return False
+
+
+def _fast_copy(src: str, dst: str, link: bool = True) -> None:
+    """
+    Copies a file using the cheapest mechanism the filesystem offers: a hard link,
+    then a reflink, then an in kernel copy_file_range and finally a regular copy
+
+    :param src: the file to copy
+    :param dst: where the copy is created
+    :param link: whether hard linking is allowed
+    """
+    if link:
+        try:
+            os.link(src, dst)
+            return
+        except OSError:
+            pass
+
+    with open(src, "rb") as f_src, open(dst, "wb") as f_dst:
+        if not _kernel_copy(f_src, f_dst):
+            shutil.copyfileobj(f_src, f_dst)
+
+
+def _copy_range(src_fd: int, dst_fd: int, offset: int, size: int) -> None:
+    """
+    Copies a whole file into another file at the given offset without moving the
+    destination's file position, so several threads can fill disjoint ranges at once
+
+    :param src_fd: descriptor of the file to copy
+    :param dst_fd: descriptor of the destination file
+    :param offset: where the copy starts in the destination
+    :param size: how many bytes to copy
+    """
+    if hasattr(os, "copy_file_range"):
+        try:
+            while size > 0:
+                copied = os.copy_file_range(src_fd, dst_fd, size, offset_dst=offset)
+                if copied == 0:
+                    break
+                offset += copied
+                size -= copied
+        except OSError:
+            pass
+
+    while size > 0:
+        block = os.read(src_fd, min(size, 1_024**2))
+        if not block:
+            break
+        written = os.pwrite(dst_fd, block, offset)
+        offset += written
+        size -= written
+
+
+def _npy_header(dtype: np.dtype, shape: tuple[int, ...]) -> bytes:
+    """
+    Builds a version 1.0 .npy header padded to a fixed size, so the header of a
+    streamed array can be rewritten in place once its final shape is known
+
+    :param dtype: the dtype of the array
+    :param shape: the shape of the array
+    :return: the encoded header, exactly _NPY_HEADER_SIZE bytes long
+    """
+    header = repr(
+        {
+            "descr": np.lib.format.dtype_to_descr(np.dtype(dtype)),
+            "fortran_order": False,
+            "shape": tuple(shape),
+        }
+    )
+
+    # magic string (6), version (2) and header length (2) precede the header
+    if len(header) + 11 > _NPY_HEADER_SIZE:
+        raise ValueError(f"dtype {dtype} is too complex to be streamed")
+
+    header = header.ljust(_NPY_HEADER_SIZE - 11) + "\n"
+
+    return (
+        np.lib.format.magic(1, 0)
+        + struct.pack("<H", len(header))
+        + header.encode("latin1")
+    )
+
+
+def _convert_rows(path: str, offset: int, row_nbytes: int, convert) -> None:
+    """
+    Rewrites the fixed size rows stored after the first offset bytes of a file, a
+    block of rows at a time so memory use stays bounded
+
+    :param path: the file to rewrite
+    :param offset: how many leading bytes are copied over untouched
+    :param row_nbytes: the size of a row, blocks never split a row
+    :param convert: maps the bytes of a block of rows to the bytes replacing them
+    """
+    tmp_path = path + ".tmp"
+
+    with open(path, "rb") as src, open(tmp_path, "wb") as dst:
+        dst.write(src.read(offset))
+
+        while block := src.read(max(row_nbytes, 1) * 4_096):
+            dst.write(convert(block))
+
+    os.replace(tmp_path, path)
+
 
 class BaseFile:
     def __init__(self):
         self._prefix = ""
         self._file_name = f"bench-{str(uuid.uuid4())}"
+        self._stream = None
 
     def reset(self):
+        self.close()
         self._file_name = f"bench-{str(uuid.uuid4())}"
 
     @property
@@ -37,25 +254,186 @@ class BaseFile:
     def save_path(self):
         return os.path.join(self.prefix, self._file_name)
 
+    @property
+    def index_path(self):
+        return self.save_path + ".index.npy"
+
+    @property
+    def stream(self):
+        """
+        The saver's file in the chunk directory, opened for writing on first use.
+        Savers that write each sample through it as it is appended keep their memory
+        use independent of the chunk size, save then only has to finalize headers and
+        indexes.
+        """
+        if self._stream is None:
+            self._stream = open(self.save_path, "wb")
+
+        return self._stream
+
+    def _reopen_stream(self):
+        # picks the stream back up at the end of a file that was rewritten
+        self.close()
+        self._stream = open(self.save_path, "r+b")
+        self._stream.seek(0, os.SEEK_END)
+
+    def close(self):
+        if self._stream is not None:
+            self._stream.close()
+            self._stream = None
+
+    def __getstate__(self):
+        # open files do not survive being sent to another process
+        state = self.__dict__.copy()
+        state["_stream"] = None
+        return state
+
+    @property
+    def nbytes(self) -> int | None:
+        """
+        How many bytes the saver takes up in the chunk directory once it is saved. It is
+        kept up to date on every append, so chunks can be cut on an exact budget without
+        saving or walking the directory. None means the saver does not keep count.
+        """
+        return None
+
+    @property
+    def file_count(self) -> int | None:
+        """
+        How many files the saver creates in the chunk directory once it is saved, None
+        means the saver does not keep count
+        """
+        return None
+
     def save(self, *args, **kwargs) -> tuple[str, str]:
         raise NotImplementedError("Save is required to write the file to disk")
 
     def append(self, *args, **kwargs) -> None:
         raise NotImplementedError("Append is required to add to the data")
 
+    def append_batch(self, items) -> None:
+        """
+        Adds several samples at once, savers override this to write them in one go
+
+        :param items: the samples, each one as it would be passed to append
+        """
+        for item in items:
+            self.append(item)
+
     def __call__(self, idx, *args, **kwargs):
         raise NotImplementedError("Append is required to add to the data")
 
 
+class _NpyWriter:
+    """
+    Streams rows of a fixed shape into the .npy file of a saver. Room for the header is
+    reserved up front and filled in by finalize, rows that were already written are
+    converted if a later row needs a wider dtype.
+    """
+
+    def __init__(self, saver: BaseFile, row_shape: tuple[int, ...] = (), dtype=None):
+        """
+        :param saver: the saver whose stream is written to
+        :param row_shape: the shape of a single row
+        :param dtype: a fixed dtype rows are cast to, if None it is inferred from the
+            rows and promoted as needed
+        """
+        self._saver = saver
+        self._fixed = dtype is not None
+        self.row_shape = tuple(row_shape)
+        self.dtype = None if dtype is None else np.dtype(dtype)
+        self.rows = 0
+
+    def write(self, rows: np.ndarray):
+        """
+        :param rows: an array of shape (n, *row_shape)
+        """
+        if rows.dtype.hasobject:
+            raise ValueError("object arrays cannot be saved")
+
+        if self._fixed:
+            self._check_cast(rows)
+
+        if self.rows == 0 and self._saver.stream.tell() == 0:
+            self._saver.stream.write(bytes(_NPY_HEADER_SIZE))
+
+        if self.dtype is None:
+            self.dtype = rows.dtype
+        elif not self._fixed and np.result_type(self.dtype, rows.dtype) != self.dtype:
+            self._promote(np.result_type(self.dtype, rows.dtype))
+
+        self._saver.stream.write(np.ascontiguousarray(rows, dtype=self.dtype).data)
+        self.rows += len(rows)
+
+    def _check_cast(self, rows: np.ndarray):
+        # a fixed dtype only narrows numbers of its own kind, and only when they fit
+        if not np.can_cast(rows.dtype, self.dtype, "same_kind"):
+            raise ValueError(f"{rows.dtype} rows cannot be stored as {self.dtype}")
+
+        if not rows.size or self.dtype.kind not in "iuf" or rows.dtype.kind == "b":
+            return
+
+        info = np.iinfo(self.dtype) if self.dtype.kind in "iu" else np.finfo(self.dtype)
+        finite = rows[np.isfinite(rows)] if rows.dtype.kind == "f" else rows
+
+        if finite.size and (finite.min() < info.min or finite.max() > info.max):
+            raise ValueError(f"rows out of the range of {self.dtype}")
+
+    def _promote(self, dtype: np.dtype):
+        old_dtype = self.dtype
+        row_nbytes = old_dtype.itemsize * int(np.prod(self.row_shape, dtype=int))
+
+        self._saver.close()
+        _convert_rows(
+            self._saver.save_path,
+            _NPY_HEADER_SIZE,
+            row_nbytes,
+            lambda block: np.frombuffer(block, old_dtype).astype(dtype).tobytes(),
+        )
+        self._saver._reopen_stream()
+
+        self.dtype = dtype
+
+    @property
+    def nbytes(self) -> int:
+        row_size = int(np.prod(self.row_shape, dtype=int))
+        itemsize = 0 if self.dtype is None else self.dtype.itemsize
+
+        return _NPY_HEADER_SIZE + self.rows * row_size * itemsize
+
+    def finalize(self, default_dtype=np.float64):
+        """
+        Writes the header for the rows written so far, more rows may still follow
+
+        :param default_dtype: the dtype recorded when no row was written
+        """
+        stream = self._saver.stream
+
+        if stream.tell() == 0:
+            stream.write(bytes(_NPY_HEADER_SIZE))
+
+        dtype = self.dtype if self.dtype is not None else np.dtype(default_dtype)
+
+        position = stream.tell()
+        stream.seek(0)
+        stream.write(_npy_header(dtype, (self.rows, *self.row_shape)))
+        stream.seek(position)
+        stream.flush()
+
+
 class TextFile(BaseFile):
     def __init__(self, line_list: list | None = None):
         super().__init__()
         self._file_name = super().file_name + "-text.txt"
         self._line_list = line_list if line_list else []
+        self._blob = None
+        self._offsets = array.array("q", [0])
 
     def save(self) -> tuple[str, str]:
-        with open(self.save_path, "w") as file:
-            file.writelines(self._line_list)
+        # lines are kept newline terminated so the file stays readable, the offsets
+        # index lets a single line be decoded without reading the others
+        self.stream.flush()
+        np.save(self.index_path, np.frombuffer(self._offsets, dtype=np.int64))
 
         return self.file_name, "textfile"
 
@@ -63,41 +441,164 @@ class TextFile(BaseFile):
         super().reset()
         self._file_name = super().file_name + "-text.txt"
         self._line_list = []
+        self._blob = None
+        self._offsets = array.array("q", [0])
 
     def append(self, line: str):
         if not line.endswith("\n"):
             line += "\n"
 
-        self._line_list.append(line)
+        written = self.stream.write(line.encode("utf-8"))
+        self._offsets.append(self._offsets[-1] + written)
+
+    def append_batch(self, lines: list[str]):
+        encoded = [
+            (line if line.endswith("\n") else line + "\n").encode("utf-8")
+            for line in lines
+        ]
+
+        self.stream.write(b"".join(encoded))
+        ends = np.cumsum([len(line) for line in encoded], dtype=np.int64)
+        self._offsets.extend((ends + self._offsets[-1]).tolist())
+
+    @property
+    def nbytes(self) -> int:
+        return self._offsets[-1] + _INDEX_HEADER_SIZE + 8 * len(self._offsets)
+
+    @property
+    def file_count(self) -> int:
+        return 2
 
     @classmethod
-    def load(cls, save_path: str):
-        with open(save_path) as file:
-            lines = file.readlines()
+    def load(
+        cls, save_path: str, mmap: bool = False, archive: ChunkArchive | None = None
+    ):
+        if not _isfile(save_path + ".index.npy", archive):
+            # chunks built before the offsets index was introduced
+            with open(save_path) as file:
+                lines = file.readlines()
 
-        return cls(line_list=lines)
+            return cls(line_list=lines)
+
+        instance = cls()
+        instance._blob = _map_bytes(save_path, mmap=mmap, archive=archive)
+        instance._offsets = _load_npy(save_path + ".index.npy", archive=archive)
+
+        return instance
 
     def __call__(self, idx, *args, **kwargs) -> str:
-        return self._line_list[idx][:-1]
+        if self._blob is None:
+            return self._line_list[idx][:-1]
 
+        start, end = self._offsets[idx], self._offsets[idx + 1]
+        return self._blob[start : end - 1].tobytes().decode("utf-8")
 
-class BooleanFile(TextFile):
-    def __init__(self, line_list: list | None = None):
-        super().__init__(line_list=line_list)
+
+class BooleanFile(BaseFile):
+    def __init__(self):
+        super().__init__()
+        self._file_name = super().file_name + "-bool.bin"
+        self._count = 0
+        self._pending = 0
+        self._bits = None
+
+    def reset(self):
+        super().reset()
+        self._file_name = super().file_name + "-bool.bin"
+        self._count = 0
+        self._pending = 0
+        self._bits = None
+
+    @property
+    def stream(self):
+        # the first 8 bytes are reserved for the sample count written by save
+        opened = self._stream is None
+        stream = super().stream
+
+        if opened:
+            stream.write(bytes(8))
+
+        return stream
 
     def append(self, line: bool):
-        super().append(str(int(line)))
+        self._pending = (self._pending << 1) | bool(line)
+        self._count += 1
+
+        if self._count % 8 == 0:
+            self.stream.write(bytes([self._pending]))
+            self._pending = 0
+
+    def append_batch(self, values):
+        values = np.asarray(values, dtype=bool).reshape(-1)
+
+        # values are appended one by one up to a byte boundary, whole bytes are then
+        # packed at once
+        head = min(-self._count % 8, len(values))
+        for value in values[:head]:
+            self.append(value)
+
+        rest = values[head:]
+        full = len(rest) - len(rest) % 8
+
+        if full:
+            self.stream.write(np.packbits(rest[:full]).tobytes())
+            self._count += full
+
+        for value in rest[full:]:
+            self.append(value)
+
+    @property
+    def nbytes(self) -> int:
+        return 8 + -(-self._count // 8)
+
+    @property
+    def file_count(self) -> int:
+        return 1
 
     def __call__(self, idx, *args, **kwargs) -> bool:
-        return bool(int(super().__call__(idx)))
+        return bool((self._bits[idx >> 3] >> (7 - (idx & 7))) & 1)
 
     def save(self):
-        name, _ = super().save()
-        return name, "bool"
+        # a little endian sample count followed by the bit packed values, the last
+        # partial byte is written without advancing so later appends overwrite it
+        stream = self.stream
+        position = stream.tell()
+
+        if self._count % 8:
+            stream.write(bytes([self._pending << (8 - self._count % 8)]))
+
+        stream.seek(0)
+        stream.write(np.array([self._count], dtype="<u8").tobytes())
+        stream.seek(position)
+        stream.flush()
+
+        return self.file_name, "bool"
+
+    @classmethod
+    def load(
+        cls, save_path: str, mmap: bool = False, archive: ChunkArchive | None = None
+    ):
+        instance = cls()
+
+        if save_path.endswith(".txt"):
+            # chunks built before bit packing stored one "0"/"1" line per value
+            with open(save_path) as file:
+                values = [int(line) for line in file]
+
+            instance._bits = np.packbits(np.array(values, dtype=bool))
+        else:
+            instance._bits = _map_bytes(save_path, mmap=mmap, archive=archive)[8:]
+
+        return instance
 
 
 class NumpyFile(BaseFile):
     def __init__(self, enforce_shape: bool, shape: tuple[int, ...] | None = None):
+        if enforce_shape and shape is None:
+            raise ValueError(
+                "NumpyFile needs a shape to enforce when enforce_shape is set"
+            )
+
         super().__init__()
         self._enforce_shape = enforce_shape
 
@@ -107,14 +608,25 @@ class NumpyFile(BaseFile):
         self._file_name = (
             file_str.format("enforced-array.npy")
             if enforce_shape
-            else file_str.format("array.npz")
+            else file_str.format("ragged-array.npy")
         )
         self.shape = shape
 
         self._arr_dict = {}
         self._npz_key_count = 0
-        self._seen_count = 0
-        self.arr = np.array([np.NaN])
+        self._index = None
+        self.arr = None
+        self._init_writer()
+
+    def _init_writer(self):
+        row_shape = self.shape if self.enforce_shape and self.shape else ()
+        self._writer = _NpyWriter(self, row_shape)
+
+        # ragged only, the start offset, ndim and shape of every appended array
+        self._starts = array.array("q")
+        self._ndims = array.array("q")
+        self._dims = array.array("q")
+        self._max_ndim = 0
 
     def reset(self):
         super().reset()
@@ -123,20 +635,13 @@ class NumpyFile(BaseFile):
         self._file_name = (
             file_str.format("enforced-array.npy")
             if self.enforce_shape
-            else file_str.format("array.npz")
+            else file_str.format("ragged-array.npy")
         )
         self.arr_dict = {}
-        self.arr = np.array([np.NaN])
+        self.arr = None
+        self.index = None
         self.npz_key_count = 0
-        self.seen_count = 0
-
-    @property
-    def seen_count(self):
-        return self._seen_count
-
-    @seen_count.setter
-    def seen_count(self, seen_count):
-        self._seen_count = seen_count
+        self._init_writer()
 
     @property
     def npz_key_count(self):
@@ -154,6 +659,14 @@ class NumpyFile(BaseFile):
     def arr_dict(self, arr_dict):
         self._arr_dict = arr_dict
 
+    @property
+    def index(self):
+        return self._index
+
+    @index.setter
+    def index(self, index: np.ndarray | None):
+        self._index = index
+
     @property
     def arr(self):
         return self._arr
@@ -175,62 +688,140 @@ class NumpyFile(BaseFile):
             arr = np.array(arr)
 
         if self.enforce_shape:
-            if arr.shape != self.shape:
+            if arr.shape != tuple(self.shape):
                 raise RuntimeError(
                     f"Enforced Shape of {self.shape} does not match array shape {arr.shape}"
                 )
 
-            arr = np.expand_dims(arr, axis=0)
+            self._writer.write(np.expand_dims(arr, axis=0))
+        else:
+            self._starts.append(self._writer.rows)
+            self._ndims.append(arr.ndim)
+            self._dims.extend(arr.shape)
+            self._max_ndim = max(self._max_ndim, arr.ndim)
+            self._writer.write(arr.reshape(-1))
+
+    def append_batch(self, arrs):
+        """
+        :param arrs: a list of arrays, or with an enforced shape an array of shape
+            (n, *shape)
+        """
+        if len(arrs) == 0:
+            return
+
+        if self.enforce_shape:
+            rows = np.asarray(arrs)
+
+            if rows.shape[1:] != tuple(self.shape):
+                raise RuntimeError(
+                    f"Enforced Shape of {self.shape} does not match array shape "
+                    f"{rows.shape[1:]}"
+                )
 
-            if np.isnan(self.arr).any():
-                self.arr = arr
-            else:
-                self.arr = np.concatenate([self.arr, arr], axis=0)
+            self._writer.write(rows)
         else:
-            self.arr_dict[f"np-{len(self.arr_dict)}"] = arr
+            arrs = [np.asarray(arr) for arr in arrs]
+            sizes = np.cumsum([0] + [arr.size for arr in arrs[:-1]], dtype=np.int64)
+
+            self._starts.extend((sizes + self._writer.rows).tolist())
+            for arr in arrs:
+                self._ndims.append(arr.ndim)
+                self._dims.extend(arr.shape)
+                self._max_ndim = max(self._max_ndim, arr.ndim)
+
+            self._writer.write(np.concatenate([arr.reshape(-1) for arr in arrs]))
+
+    @property
+    def nbytes(self) -> int:
+        if self.enforce_shape:
+            return self._writer.nbytes
+
+        index_nbytes = 8 * len(self._ndims) * (2 + self._max_ndim)
+        return self._writer.nbytes + _INDEX_HEADER_SIZE + index_nbytes
+
+    @property
+    def file_count(self) -> int:
+        return 1 if self.enforce_shape else 2
 
     def __call__(self, idx, *args, **kwargs):
         if self.enforce_shape:
             return self.arr[idx]
+        elif self.index is not None:
+            start, ndim = self.index[idx, :2]
+            shape = self.index[idx, 2 : 2 + ndim]
+            return self.arr[start : start + np.prod(shape, dtype=int)].reshape(shape)
         else:
-            self.seen_count += 1
-            ret_arr = self.arr_dict[f"np-{idx}"]
-            if self.npz_key_count == self.seen_count:
-                self.arr_dict.close()
-            return ret_arr
+            return self.arr_dict[f"np-{idx}"]
 
     @classmethod
-    def load(cls, save_path: str, enforce_shape: bool):
-        instance = cls(enforce_shape)
+    def load(
+        cls,
+        save_path: str,
+        enforce_shape: bool,
+        mmap: bool = False,
+        archive: ChunkArchive | None = None,
+    ):
+        if enforce_shape:
+            # copy-on-write keeps the rows lazy while handing out writable views
+            arr = _load_npy(save_path, mmap=mmap, archive=archive)
+            instance = cls(enforce_shape, shape=arr.shape[1:])
+            instance.arr = arr
 
-        loaded_array = np.load(save_path, allow_pickle=True)
+            return instance
 
-        if enforce_shape:
-            instance.arr = loaded_array
-        else:
+        instance = cls(enforce_shape)
+
+        if save_path.endswith(".npz"):
+            # chunks built before the ragged layout was introduced
+            loaded_array = np.load(save_path, allow_pickle=True)
             instance.arr_dict = loaded_array
             instance.npz_key_count = len(loaded_array.keys())
+        else:
+            instance.arr = _load_npy(save_path, mmap=mmap, archive=archive)
+            instance.index = _load_npy(save_path + ".index.npy", archive=archive)
 
         return instance
 
+    def _ragged_index(self) -> np.ndarray:
+        """
+        :return: one row per array holding its start offset in the flat buffer, its
+            ndim and its shape (padded with zeros to the largest ndim)
+        """
+        ndims = np.frombuffer(self._ndims, dtype=np.int64)
+        max_ndim = int(ndims.max(initial=0))
+
+        index = np.zeros((len(ndims), 2 + max_ndim), dtype=np.int64)
+        index[:, 0] = np.frombuffer(self._starts, dtype=np.int64)
+        index[:, 1] = ndims
+
+        rows = np.repeat(np.arange(len(ndims)), ndims)
+        first_dim = np.repeat(np.cumsum(ndims) - ndims, ndims)
+        index[rows, 2 + np.arange(len(rows)) - first_dim] = np.frombuffer(
+            self._dims, dtype=np.int64
+        )
+
+        return index
+
     def save(self):
-        if self.enforce_shape:
-            np.save(self.save_path, self.arr)
+        self._writer.finalize()
 
+        if self.enforce_shape:
             return self.file_name, "enforced_arr"
         else:
-            np.savez(self.save_path, **self.arr_dict)
+            np.save(self.index_path, self._ragged_index())
             return self.file_name, "arr"
 
 
 class TorchFile(BaseFile):
     def __init__(self, shape: tuple[int, ...]):
         super().__init__()
-        self._file_name = super().file_name + "-ten.pt"
+        self._file_name = super().file_name + "-ten.bin"
         self.shape = torch.Size(shape)
 
         self._ten = None
-        self._cat = False
+        self._dtype = None
+        self._count = 0
+        self._row_nbytes = 0
 
     @property
     def ten(self):
@@ -240,47 +831,129 @@ class TorchFile(BaseFile):
     def ten(self, ten: torch.Tensor):
         self._ten = ten
 
-    def append(self, ten: torch.Tensor):
-        if isinstance(ten, (list, np.ndarray)):
-            ten = torch.Tensor(ten)
+    @property
+    def header_path(self):
+        return self.save_path + ".json"
+
+    def _promote(self, dtype: torch.dtype):
+        old_dtype = self._dtype
+        row_nbytes = torch.empty((), dtype=old_dtype).element_size()
+        row_nbytes *= self.shape.numel()
+
+        def convert(block: bytes) -> bytes:
+            ten = torch.frombuffer(bytearray(block), dtype=old_dtype).to(dtype)
+            return ten.view(torch.uint8).numpy().tobytes()
+
+        self.close()
+        _convert_rows(self.save_path, 0, row_nbytes, convert)
+        self._reopen_stream()
+
+        self._dtype = dtype
+
+    @staticmethod
+    def _as_tensor(ten) -> torch.Tensor:
+        if isinstance(ten, np.ndarray):
+            return torch.as_tensor(np.ascontiguousarray(ten))
+        elif isinstance(ten, list):
+            # torch.tensor, unlike torch.Tensor, keeps the incoming dtype
+            return torch.tensor(ten)
         elif isinstance(ten, torch.Tensor):
-            pass
+            return ten.detach().cpu()
         else:
             raise ValueError(f"TorchFile does not accept {ten.__class__}")
 
-        if ten.size() != self.shape:
+    def _write_rows(self, rows: torch.Tensor):
+        if rows.size()[1:] != self.shape:
             raise RuntimeError(
-                f"Enforced Shape of {self.shape} does not match tensor shape {ten.size()}"
+                f"Enforced Shape of {self.shape} does not match tensor shape "
+                f"{rows.size()[1:]}"
             )
 
-        ten = torch.unsqueeze(ten, dim=0)
+        if self._dtype is None:
+            self._dtype = rows.dtype
+        elif torch.promote_types(self._dtype, rows.dtype) != self._dtype:
+            self._promote(torch.promote_types(self._dtype, rows.dtype))
+
+        # rows are written as raw contiguous bytes, so the file can be memory mapped
+        data = rows.to(self._dtype).contiguous().view(-1).view(torch.uint8)
+        self.stream.write(data.numpy().data)
+        self._count += len(rows)
+        self._row_nbytes = data.numel() // len(rows)
+
+    def append(self, ten: torch.Tensor):
+        self._write_rows(self._as_tensor(ten).unsqueeze(0))
+
+    def append_batch(self, tens):
+        """
+        :param tens: a tensor or array of shape (n, *shape), or a list of tensors
+        """
+        if len(tens) == 0:
+            return
 
-        if not self._cat:
-            self.ten = ten
-            self._cat = True
+        if isinstance(tens, list) and isinstance(tens[0], (torch.Tensor, np.ndarray)):
+            rows = torch.stack([self._as_tensor(ten) for ten in tens])
         else:
-            self.ten = torch.cat((self.ten, ten), dim=0)
+            rows = self._as_tensor(tens)
+
+        self._write_rows(rows)
+
+    @property
+    def header(self) -> dict:
+        dtype = self._dtype if self._dtype is not None else torch.float32
+
+        return {
+            "dtype": str(dtype).split(".")[-1],
+            "shape": [self._count, *self.shape],
+        }
+
+    @property
+    def nbytes(self) -> int:
+        return self._count * self._row_nbytes + len(json.dumps(self.header))
+
+    @property
+    def file_count(self) -> int:
+        return 2
 
     def save(self):
-        torch.save(self.ten, self.save_path)
+        self.stream.flush()
+
+        with open(self.header_path, "w") as file:
+            json.dump(self.header, file)
 
         return self.file_name, "ten"
 
     @classmethod
-    def load(cls, save_path: str):
-        instance = cls((1, 1, 1))
+    def load(
+        cls, save_path: str, mmap: bool = False, archive: ChunkArchive | None = None
+    ):
+        if save_path.endswith(".pt"):
+            # chunks built before the raw layout was introduced
+            instance = cls((1, 1, 1))
+            instance.ten = torch.load(save_path)
+            return instance
+
+        header = _read_json(save_path + ".json", archive)
 
-        loaded_tensor = torch.load(save_path)
+        shape = header["shape"]
+        dtype = getattr(torch, header["dtype"])
 
-        instance.ten = loaded_tensor
+        instance = cls(shape[1:])
+
+        if shape[0] == 0:
+            instance.ten = torch.empty(shape, dtype=dtype)
+        else:
+            buffer = _map_bytes(save_path, mmap=mmap, archive=archive)
+            instance.ten = torch.frombuffer(buffer, dtype=dtype).view(shape)
 
         return instance
 
     def reset(self):
         super().reset()
-        self._file_name = super().file_name + "-ten.pt"
+        self._file_name = super().file_name + "-ten.bin"
         self.ten = None
-        self._cat = False
+        self._dtype = None
+        self._count = 0
+        self._row_nbytes = 0
 
     def __call__(self, idx, *args, **kwargs):
         return self.ten[idx]
@@ -290,15 +963,28 @@ class JsonFile(BaseFile):
     def __init__(self):
         super().__init__()
         self._json_list = []
-        self._file_name = super().file_name + "-json.json"
+        self._records = None
+        self._offsets = array.array("q", [0])
+        self._file_name = super().file_name + "-json.jsonl"
 
     def append(self, app):
-        self.json_list.append(app)
+        written = self.stream.write(json.dumps(app).encode("utf-8") + b"\n")
+        self._offsets.append(self._offsets[-1] + written)
+
+    @property
+    def nbytes(self) -> int:
+        return self._offsets[-1] + _INDEX_HEADER_SIZE + 8 * len(self._offsets)
+
+    @property
+    def file_count(self) -> int:
+        return 2
 
     def reset(self):
         super().reset()
         self.json_list = []
-        self._file_name = super().file_name + "-json.json"
+        self._records = None
+        self._offsets = array.array("q", [0])
+        self._file_name = super().file_name + "-json.jsonl"
 
     @property
     def json_list(self):
@@ -309,73 +995,166 @@ class JsonFile(BaseFile):
         self._json_list = j_list
 
     def save(self):
-        with open(self.save_path, "w") as f:
-            json.dump(self.json_list, f)
+        self.stream.flush()
+        np.save(self.index_path, np.frombuffer(self._offsets, dtype=np.int64))
 
         return self.file_name, "json"
 
     @classmethod
-    def load(cls, save_path: str):
-        with open(save_path) as file:
-            j_list = json.load(file)
-
+    def load(
+        cls, save_path: str, mmap: bool = False, archive: ChunkArchive | None = None
+    ):
         instance = cls()
 
-        instance.json_list = j_list
+        if save_path.endswith(".json"):
+            # chunks built before json lines were introduced
+            with open(save_path) as file:
+                instance.json_list = json.load(file)
+        else:
+            instance._records = _map_bytes(save_path, mmap=mmap, archive=archive)
+            instance._offsets = _load_npy(save_path + ".index.npy", archive=archive)
 
         return instance
 
     def __call__(self, idx, *args, **kwargs):
+        if self._records is not None:
+            start, end = self._offsets[idx], self._offsets[idx + 1]
+            return json.loads(self._records[start:end].tobytes())
+
         return self.json_list[idx]
 
 
 class NumericFile(BaseFile):
-    def __init__(self):
+    def __init__(self, dtype: np.dtype | str | None = None):
+        """
+        :param dtype: the dtype the numbers are stored as, if None int64 is used when
+            every number is an integer and float64 otherwise. Pass a narrower dtype
+            such as int16 or float32 to shrink the column.
+        """
         super().__init__()
-        self._file_name = super().file_name + "-num.pkl"
+        self._file_name = super().file_name + "-num.npy"
         self._numeric_list = []
+        self._dtype = dtype
+        self._writer = _NpyWriter(self, dtype=dtype)
 
     @property
     def numeric_list(self):
         return self._numeric_list
 
     @numeric_list.setter
-    def numeric_list(self, num_list: list[float | int]):
+    def numeric_list(self, num_list: list[float | int] | np.ndarray):
         self._numeric_list = num_list
 
+    @property
+    def dtype(self) -> np.dtype | None:
+        return self._writer.dtype
+
     def reset(self):
         super().reset()
-        self._file_name = super().file_name + "-num.pkl"
+        self._file_name = super().file_name + "-num.npy"
         self.numeric_list = []
+        self._writer = _NpyWriter(self, dtype=self._dtype)
+
+    def _write(self, numbers: np.ndarray):
+        if numbers.dtype.kind not in "biuf":
+            raise ValueError(f"NumericFile expects numbers, got {numbers.dtype} values")
+
+        self._writer.write(numbers)
 
     def append(self, number):
-        self.numeric_list.append(number)
+        self._write(np.array([number]))
+
+    def append_batch(self, numbers):
+        numbers = np.asarray(numbers)
+
+        if numbers.ndim != 1:
+            raise ValueError("NumericFile expects a flat batch of numbers")
+
+        if len(numbers):
+            self._write(numbers)
+
+    @property
+    def nbytes(self) -> int:
+        return self._writer.nbytes
+
+    @property
+    def file_count(self) -> int:
+        return 1
 
     def save(self):
-        with open(self.save_path, "wb") as file:
-            pickle.dump(self.numeric_list, file)
+        self._writer.finalize(default_dtype=np.int64)
 
         return self.file_name, "num"
 
     @classmethod
-    def load(cls, save_path: str):
-        # TODO: Possible security issue as stated by S301.
-        with open(save_path, "rb") as file:
-            my_var = pickle.load(file)  # noqa S301
-
+    def load(
+        cls, save_path: str, mmap: bool = False, archive: ChunkArchive | None = None
+    ):
         instance = cls()
-        instance.numeric_list = my_var
+
+        if save_path.endswith(".pkl"):
+            # chunks built before the typed column was introduced
+            # TODO: Possible security issue as stated by S301.
+            with open(save_path, "rb") as file:
+                instance.numeric_list = pickle.load(file)  # noqa S301
+        else:
+            instance.numeric_list = _load_npy(save_path, mmap=mmap, archive=archive)
 
         return instance
 
     def __call__(self, idx, *args, **kwargs):
-        return self.numeric_list[idx]
+        number = self.numeric_list[idx]
+
+        # hand back plain python numbers, like the pickled lists did
+        return number.item() if isinstance(number, np.generic) else number
 
 
 class RawFile(BaseFile):
-    def __init__(self):
+    def __init__(
+        self,
+        workers: int = 8,
+        dedupe: bool = True,
+        link: bool = True,
+        packed: bool = False,
+    ):
+        """
+        :param workers: how many threads copy files into the chunk in the background
+        :param dedupe: store files with identical content only once per chunk
+        :param link: try to hard link files into the chunk before copying them, the
+            source files must then not be modified until the chunk is compressed. The
+            link or copy is taken when a file is appended, so the source can be
+            deleted right after
+        :param packed: pack the files into a single blob with an offset index instead
+            of a folder of loose files, this avoids creating thousands of inodes when
+            a chunk is extracted
+        """
         super().__init__()
         self._file_list = []
+        self._workers = workers
+        self._dedupe = dedupe
+        self._link = link
+        self._packed = packed
+        self._executor = None
+        self._lock = threading.Lock()
+        self._blob = None
+        self._entries = None
+        self._materialize = False
+
+        if packed:
+            self._file_name += "-raw.bin"
+
+        self._init_ingestion()
+
+    def _init_ingestion(self):
+        self._samples = []  # the name allocated to each appended sample
+        self._sources = {}  # allocated name -> resolved source path
+        self._futures = {}  # allocated name -> future of the content digest
+        self._holders = {}  # content digest -> name the content was stored under
+        self._ranges = {}  # packed only, stored name -> (start, end) in the blob
+        self._blob_size = 0
+        self._stored_nbytes = 0  # bytes of every distinct member scheduled so far
+        self._stored_count = 0
+        self._ann_nbytes = 2
 
     @property
     def file_list(self):
@@ -391,39 +1170,240 @@ class RawFile(BaseFile):
 
     @prefix.setter
     def prefix(self, prefix):
-        os.mkdir(os.path.join(prefix, self.file_name))
+        if not self._packed:
+            os.mkdir(os.path.join(prefix, self.file_name))
         self._prefix = prefix
 
+    def __getstate__(self):
+        state = super().__getstate__()
+        state["_executor"] = None
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self._workers)
+
+        return self._executor
+
     def reset(self):
         super().reset()
+
+        if self._packed:
+            self._file_name += "-raw.bin"
+
         self._file_list = []
+        self._init_ingestion()
+
+    def _pack(self, file_list: list[str]):
+        """
+        Copies the staged files into the blob. Members are laid out in the order they
+        were first appended, so the blob does not depend on the order the pool
+        finished in, the copies into their ranges then run in parallel.
+        """
+        # opened here rather than in the copying threads, which only use its fd
+        blob = self.stream.fileno()
+        copies = []
+
+        for name in dict.fromkeys(file_list):
+            # members packed by an earlier save keep their range
+            if name in self._ranges:
+                continue
+
+            staged_path = os.path.join(self._stage_path, name)
+            size = os.path.getsize(staged_path)
+
+            self._ranges[name] = (self._blob_size, self._blob_size + size)
+            copies.append(
+                self.executor.submit(
+                    self._copy_member, staged_path, blob, self._blob_size, size
+                )
+            )
+            self._blob_size += size
+
+        for copy in copies:
+            copy.result()
+
+        shutil.rmtree(self._stage_path, ignore_errors=True)
+
+    @staticmethod
+    def _copy_member(staged_path: str, blob: int, start: int, size: int):
+        with open(staged_path, "rb") as file:
+            _copy_range(file.fileno(), blob, start, size)
+
+    @property
+    def _stage_path(self) -> str:
+        # files are linked or copied here as they are appended, a packed RawFile
+        # copies them into its blob later and removes the folder
+        return self.save_path + "-staging" if self._packed else self.save_path
+
+    def _ingest(self, staged_path: str, name: str) -> str | None:
+        digest = _file_digest(staged_path) if self._dedupe else None
+
+        if digest is not None:
+            with self._lock:
+                if digest in self._holders:
+                    self._stored_nbytes -= os.path.getsize(staged_path)
+                    self._stored_count -= 1
+                    os.remove(staged_path)
+                    return digest
+
+                self._holders[digest] = name
+
+        return digest
 
     def append(self, file_path: str):
         file_name = os.path.split(file_path)[-1]
-        self._file_list.append(file_name)
+        source = os.path.realpath(file_path)
 
-        if file_name in self._file_list:
-            warnings.warn(f"Duplicate file named: {file_name} found", stacklevel=2)
+        if self._sources.get(file_name, source) != source:
+            warnings.warn(
+                f"Duplicate file named: {file_name} found, it will be stored as "
+                f"{len(self._samples)}-{file_name}",
+                stacklevel=2,
+            )
+            file_name = f"{len(self._samples)}-{file_name}"
+
+        # appending the same file again reuses the copy that is already scheduled
+        if file_name not in self._sources:
+            # only hashing and deduplication run in the background, the file is
+            # linked or copied right away in case the caller removes it
+            os.makedirs(self._stage_path, exist_ok=True)
+            staged_path = os.path.join(self._stage_path, file_name)
+            _fast_copy(file_path, staged_path, link=self._link)
+
+            with self._lock:
+                self._stored_nbytes += os.path.getsize(staged_path)
+                self._stored_count += 1
+
+            self._sources[file_name] = source
+            self._futures[file_name] = self.executor.submit(
+                self._ingest, staged_path, file_name
+            )
+
+        self._samples.append(file_name)
+
+        # the annotation entry, plus the byte range of a packed member
+        self._ann_nbytes += len(json.dumps(file_name)) + 2 + 24 * self._packed
+
+    @property
+    def nbytes(self) -> int:
+        # members are counted when scheduled and dropped once found to be duplicates,
+        # the annotation size is an estimate since the offsets are not known yet
+        return self._stored_nbytes + self._ann_nbytes
+
+    @property
+    def file_count(self) -> int:
+        return 2 if self._packed else self._stored_count + 1
+
+    def _resolve_samples(self) -> list[str]:
+        """
+        Waits for the pending copies and maps every sample to the file holding its
+        content. Duplicates always point at the first sample with that content, which
+        keeps the chunk independent of the order the copies finished in.
+
+        :return: the stored file name of every sample
+        """
+        canonical = {}
+        file_list = []
+
+        for name in self._samples:
+            digest = self._futures[name].result()
+
+            if digest is None:
+                file_list.append(name)
+                continue
+
+            if digest not in canonical:
+                canonical[digest] = name
+                holder = self._holders[digest]
+
+                if holder != name:
+                    os.replace(
+                        os.path.join(self._stage_path, holder),
+                        os.path.join(self._stage_path, name),
+                    )
+                    self._holders[digest] = name
+
+            file_list.append(canonical[digest])
 
-        shutil.copyfile(file_path, os.path.join(self.save_path, file_name))
+        return file_list
 
     def save(self):
+        self.file_list = self._resolve_samples()
+
+        if self._packed:
+            self._pack(self.file_list)
+            self.stream.flush()
+
+            with open(self.save_path + ".index.json", "w") as file:
+                json.dump([[i, *self._ranges[i]] for i in self.file_list], file)
+
+            return self.file_name, "blob"
+
         with open(os.path.join(self.save_path, "ann.json"), "w") as file:
             json.dump(self.file_list, file)
 
         return self.file_name, "folder"
 
     @classmethod
-    def load(cls, save_path: str):
+    def load(
+        cls,
+        save_path: str,
+        mmap: bool = False,
+        materialize: bool = False,
+        archive: ChunkArchive | None = None,
+    ):
+        """
+        :param save_path: the chunk folder, or the blob of a packed RawFile
+        :param mmap: memory map the blob of a packed RawFile
+        :param materialize: have a packed RawFile return file paths instead of bytes,
+            each member is written out next to the blob the first time it is read
+        :param archive: the chunk archive a packed RawFile is read from, a folder
+            RawFile or materialize need the chunk unpacked
+        :return: the loaded RawFile
+        """
+        instance = cls()
+
+        if archive is not None or not os.path.isdir(save_path):
+            instance._entries = _read_json(save_path + ".index.json", archive)
+            instance._blob = _map_bytes(save_path, mmap=mmap, archive=archive)
+            instance._materialize = materialize
+            instance.file_list = [
+                os.path.join(save_path + "-files", name)
+                for name, _, _ in instance._entries
+            ]
+
+            return instance
+
         with open(os.path.join(save_path, "ann.json")) as file:
             file_list = json.load(file)
 
         file_list = [os.path.join(save_path, i) for i in file_list]
 
-        instance = cls()
         instance.file_list = file_list
 
         return instance
 
     def __call__(self, idx, *args, **kwargs):
-        return self.file_list[idx]
+        if self._entries is None:
+            return self.file_list[idx]
+
+        _, start, end = self._entries[idx]
+
+        if not self._materialize:
+            return self._blob[start:end].tobytes()
+
+        path = self.file_list[idx]
+
+        if not os.path.isfile(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as file:
+                file.write(self._blob[start:end])
+
+        return path
@@ -1,22 +1,39 @@
+import collections
+import functools
+import hashlib
+import itertools
 import json
+import multiprocessing
 import os
 import pathlib
 import shutil
 import tarfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import ThreadPoolExecutor
 
 import numpy as np
 from colorama import Fore
 from colorama import Style
+from filelock import FileLock
 from torch.utils.data import DataLoader
 from tqdm import tqdm
 
 from benchkit.data.datasets import IterableChunk
 from benchkit.data.datasets import ProcessorDataset
+from benchkit.data.file_saver import RawFile
+from benchkit.data.manifest import ChunkIndex
+from benchkit.data.manifest import file_checksum
+from benchkit.data.manifest import manifest_path
+from benchkit.data.manifest import read_manifest
+from benchkit.data.permutation import make_order
 from benchkit.misc.requests.dataset import create_dataset
 from benchkit.misc.requests.dataset import delete_dataset
 from benchkit.misc.requests.dataset import get_chunk_count
 from benchkit.misc.requests.dataset import get_current_dataset
+from benchkit.misc.requests.dataset import get_existing_chunk_hashes
 from benchkit.misc.requests.dataset import get_post_url
+from benchkit.misc.requests.dataset import link_chunk
 from benchkit.misc.utils.bucket import upload_using_presigned_url
 
 megabyte = 1_024**2
@@ -35,22 +52,32 @@ def get_folder_size(dataset_path) -> int:
 
     for root, _, files in os.walk(dataset_path, topdown=False):
         for name in files:
-            if name.endswith(".tar.gz"):
+            if name.endswith((".tar", ".tar.gz")):
                 size += os.path.getsize(os.path.join(root, name))
 
     return size
 
 
 def get_dataloader(
-    dataset: IterableChunk, dataset_name: str, num_workers=0, batch_size=16
+    dataset: IterableChunk,
+    dataset_name: str,
+    num_workers=0,
+    batch_size=16,
+    process_index=0,
+    num_processes=1,
 ) -> DataLoader:
     dataset.post_init(dataset_name, True)
+    # the process_index and num_processes of an Accelerator, every process streams an
+    # even share of the chunks
+    dataset.set_rank(process_index, num_processes)
 
     dl = DataLoader(
         dataset=dataset,
         num_workers=num_workers,
         batch_size=batch_size,
         worker_init_fn=IterableChunk.worker_init_fn,
+        # workers keep their copy of the dataset, so its epoch advances every epoch
+        persistent_workers=num_workers > 0,
     )
 
     return dl
@@ -70,15 +97,23 @@ def get_test_dataloader(dataset: IterableChunk, dataset_name: str, ds_len: int):
 
 
 def get_local_dataloader(
-    chunk_dataset: IterableChunk, dataset_name: str, batch_size: int, num_workers: int
+    chunk_dataset: IterableChunk,
+    dataset_name: str,
+    batch_size: int,
+    num_workers: int,
+    process_index: int = 0,
+    num_processes: int = 1,
 ):
     chunk_dataset.post_init(dataset_name, cloud=False)
+    chunk_dataset.set_rank(process_index, num_processes)
 
     dl = DataLoader(
         dataset=chunk_dataset,
         num_workers=num_workers,
         batch_size=batch_size,
         worker_init_fn=IterableChunk.worker_init_fn,
+        # workers keep their copy of the dataset, so its epoch advances every epoch
+        persistent_workers=num_workers > 0,
     )
 
     return dl
@@ -90,14 +125,26 @@ def remove_all_temps():
             shutil.rmtree(os.path.join("", i))
 
 
-def create_dataset_zips(processed_dataset: ProcessorDataset, dataset_name: str):
+def create_dataset_zips(
+    processed_dataset: ProcessorDataset,
+    dataset_name: str,
+    num_workers: int = 1,
+    resume: bool = False,
+    chunk_format: str = "tar.gz",
+):
     project_dataset_path = os.path.join("ProjectDatasets", dataset_name)
-    if os.path.isdir(project_dataset_path):
+    if os.path.isdir(project_dataset_path) and not resume:
         shutil.rmtree(project_dataset_path)
 
     print(Fore.RED + "Started data processing" + Style.RESET_ALL)
 
-    count = save_file_and_label(processed_dataset, dataset_name)
+    count = save_file_and_label(
+        processed_dataset,
+        dataset_name,
+        num_workers=num_workers,
+        resume=resume,
+        chunk_format=chunk_format,
+    )
 
     print(Fore.GREEN + "data is processed" + Style.RESET_ALL)
 
@@ -136,7 +183,94 @@ def test_dataloading(dataset_name: str, chunk_dataset: IterableChunk):
     print(Fore.GREEN + "data Loading Test Passed" + Style.RESET_ALL)
 
 
-def run_upload(dataset_name: str):
+class ChunkHashIndex:
+    """
+    Looks up which chunk contents were already uploaded to the project
+    """
+
+    def existing(self, hashes: list[str]) -> set[str]:
+        """
+        :param hashes: content hashes of chunks about to be uploaded
+        :return: the hashes that do not need to be uploaded again
+        """
+        return set(get_existing_chunk_hashes(hashes)) if hashes else set()
+
+    def link(self, dataset_id: str, content_hash: str, file_name: str, file_count: int):
+        """
+        adds a chunk whose content is already uploaded to the dataset
+        """
+        link_chunk(dataset_id, content_hash, file_name, file_count)
+
+    def add(self, content_hash: str):
+        """
+        called once a chunk is uploaded, the server records the hash of uploads itself
+        """
+        pass
+
+
+class LocalChunkHashIndex(ChunkHashIndex):
+    """
+    Stand-in for the hash lookup of the server, keeping the hashes in a json file
+
+    :param path: the json file the hashes are kept in
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def _read(self) -> dict:
+        if not os.path.isfile(self.path):
+            return {}
+
+        with open(self.path) as f:
+            return json.load(f)
+
+    def _write(self, hashes: dict):
+        with open(self.path, "w") as f:
+            json.dump(hashes, f, indent=2)
+
+    def existing(self, hashes: list[str]) -> set[str]:
+        return set(hashes) & set(self._read())
+
+    def link(self, dataset_id: str, content_hash: str, file_name: str, file_count: int):
+        hashes = self._read()
+        hashes[content_hash].append(file_name)
+        self._write(hashes)
+
+    def add(self, content_hash: str):
+        hashes = self._read()
+        hashes.setdefault(content_hash, [])
+        self._write(hashes)
+
+
+def _chunk_hashes(save_path: str) -> dict:
+    if not os.path.isfile(manifest_path(save_path)):
+        return {}
+
+    return {
+        chunk["file"]: chunk["hash"]
+        for chunk in read_manifest(save_path)["chunks"]
+        if chunk.get("hash")
+    }
+
+
+def run_upload(
+    dataset_name: str,
+    hash_index: ChunkHashIndex | None = None,
+    delete_build: bool = False,
+):
+    """
+    Uploads the chunks of a processed dataset, chunks whose content was already
+    uploaded to the project are linked to the dataset instead
+
+    :param dataset_name: the name of the dataset
+    :param hash_index: looks up the content hashes already uploaded, defaults to the
+        lookup of the server
+    :param delete_build: delete the build once it is uploaded. Builds with a manifest
+        are kept otherwise, so the next build can resume or append to them
+    """
+    hash_index = ChunkHashIndex() if hash_index is None else hash_index
+
     ds = get_current_dataset(dataset_name)
 
     if not ds:
@@ -159,30 +293,49 @@ def run_upload(dataset_name: str):
     print(Fore.RED + "Started Upload" + Style.RESET_ALL)
 
     last_file_number = get_chunk_count(ds["id"])
+    chunk_index = ChunkIndex.from_folder(save_path)
+    positions = range(last_file_number, len(chunk_index))
+
+    chunk_hashes = _chunk_hashes(save_path)
+    uploaded = hash_index.existing(
+        [
+            chunk_hashes[os.path.split(chunk_index.chunks[i])[-1]]
+            for i in positions
+            if os.path.split(chunk_index.chunks[i])[-1] in chunk_hashes
+        ]
+    )
+
+    for i in tqdm(positions, colour="blue"):
+        path = chunk_index.chunks[i]
+        file_name = os.path.split(path)[-1]
 
-    for path in tqdm(
-        iterate_directory(save_path, last_file_number),
-        total=(len(os.listdir(save_path)) - last_file_number),
-        colour="blue",
-    ):
-        file_count: str = os.path.split(path)[-1]
+        start, end = chunk_index.sample_range(i)
+        file_count = end - start
 
-        file_count: int = int(file_count.split("-")[-1][: -len(".tar.gz")])
+        content_hash = chunk_hashes.get(file_name)
+
+        if content_hash in uploaded:
+            hash_index.link(ds["id"], content_hash, file_name, file_count)
+            continue
 
         response = get_post_url(
-            ds["id"], os.path.getsize(path), os.path.split(path)[-1], file_count
+            ds["id"], os.path.getsize(path), file_name, file_count, content_hash
         )
 
         resp = json.loads(response.content)
-        upload_using_presigned_url(
-            resp["url"], path, os.path.split(path)[-1], resp["fields"]
-        )
+        upload_using_presigned_url(resp["url"], path, file_name, resp["fields"])
+
+        if content_hash is not None:
+            hash_index.add(content_hash)
+            uploaded.add(content_hash)
 
         ds = get_current_dataset(dataset_name)
 
     print(Fore.GREEN + "Finished Upload" + Style.RESET_ALL)
 
-    shutil.rmtree(save_path)
+    # builds from before the manifest cannot be resumed, so there is no use in them
+    if delete_build or not os.path.isfile(manifest_path(save_path)):
+        shutil.rmtree(save_path)
 
 
 def get_directory_size(dataset_path) -> int:
@@ -208,18 +361,305 @@ def get_total_file_count(directory):
     return 0 if idx == 0 else total_files
 
 
+def _start_chunk(dataset: ProcessorDataset, scratch_folder: str, chunk_num: int):
+    os.mkdir(os.path.join(scratch_folder, f"dataset-{chunk_num}"))
+    dataset.prefix = os.path.join(scratch_folder, f"dataset-{chunk_num}")
+    dataset.reset_savers()
+    dataset.prepare()
+
+
+class _ChunkCompressor:
+    """
+    Compresses finished chunks on background threads while the next chunk is filled
+
+    :param max_pending: how many chunks may wait on compression before the caller is
+        blocked, bounding the uncompressed chunks kept on disk
+    """
+
+    def __init__(self, max_pending: int = 2):
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_pending)
+        self._pending = collections.deque()
+
+    @staticmethod
+    def _compress(directory_path: str, output_filename: str, on_done):
+        content_hash = chunk_digest(
+            directory_path, "tar.gz" if output_filename.endswith(".gz") else "tar"
+        )
+
+        # the chunk only appears under its name once it is complete
+        compress_directory(
+            directory_path,
+            output_filename + ".tmp",
+            compress=output_filename.endswith(".gz"),
+        )
+        os.replace(output_filename + ".tmp", output_filename)
+
+        if on_done is not None:
+            on_done(content_hash)
+
+    def submit(self, directory_path: str, output_filename: str, on_done=None):
+        while len(self._pending) >= self.max_pending:
+            self._pending.popleft().result()
+
+        self._pending.append(
+            self._executor.submit(
+                self._compress, directory_path, output_filename, on_done
+            )
+        )
+
+    def wait(self):
+        while self._pending:
+            self._pending.popleft().result()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        try:
+            if exc_type is None:
+                self.wait()
+        finally:
+            self._executor.shutdown(wait=True)
+
+
+def _build_lock(save_folder: str) -> FileLock:
+    # build workers and compression threads all record chunks in the manifest
+    return FileLock(os.path.join(save_folder, "manifest.lock"))
+
+
+def _write_manifest(save_folder: str, manifest: dict):
+    tmp_path = manifest_path(save_folder) + ".tmp"
+
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+
+    os.replace(tmp_path, manifest_path(save_folder))
+
+
+def _record_chunk(
+    save_folder: str,
+    file_name: str,
+    start: int,
+    end: int,
+    tags: list[str],
+    content_hash: str,
+):
+    path = os.path.join(save_folder, file_name)
+    size, checksum = os.path.getsize(path), file_checksum(path)
+
+    with _build_lock(save_folder):
+        manifest = read_manifest(save_folder)
+        manifest["chunks"].append(
+            {
+                "number": None,
+                "file": file_name,
+                "sample_count": end - start,
+                "start": start,
+                "end": end,
+                "size": size,
+                "tags": tags,
+                "checksum": checksum,
+                "hash": content_hash,
+            }
+        )
+        _write_manifest(save_folder, manifest)
+
+
+def _new_segment(
+    dataset: ProcessorDataset, save_folder: str, start: int, stop: int
+) -> dict:
+    # a dataset without a seed gets one derived from its name and the segment start,
+    # so resuming, or rebuilding the same data, reproduces the same chunks and their
+    # content hashes still match the chunks already uploaded
+    seed = dataset.seed
+    if seed is None:
+        name = os.path.basename(os.path.normpath(save_folder))
+        digest = hashlib.blake2b(f"{name}:{start}".encode(), digest_size=8).digest()
+        seed = int.from_bytes(digest, "little") % 2**63
+
+    return {
+        "start": start,
+        "stop": stop,
+        "ordering": dataset.ordering,
+        "seed": seed,
+        "block_size": dataset.block_size,
+    }
+
+
+def _order_range(segments: list[dict], start: int, stop: int):
+    for segment in segments:
+        lo, hi = max(start, segment["start"]), min(stop, segment["stop"])
+
+        if lo < hi:
+            order = make_order(
+                segment["ordering"],
+                segment["start"],
+                segment["stop"],
+                segment["seed"],
+                segment["block_size"],
+            )
+            yield from order[lo - segment["start"] : hi - segment["start"]]
+
+
+def _prepare_build(dataset: ProcessorDataset, save_folder: str) -> dict:
+    if not os.path.isfile(manifest_path(save_folder)):
+        manifest = {
+            "length": len(dataset),
+            "segments": [_new_segment(dataset, save_folder, 0, len(dataset))],
+            "chunks": [],
+        }
+        _write_manifest(save_folder, manifest)
+        return manifest
+
+    manifest = read_manifest(save_folder)
+    length = len(dataset)
+
+    if length < manifest["length"]:
+        raise UploadError(
+            f"The dataset has {length} samples, the build being resumed already "
+            f"covers {manifest['length']}"
+        )
+
+    if length > manifest["length"]:
+        # indices past the recorded length are new samples, they are processed
+        # after the old ones so the chunks already built stay valid
+        manifest["segments"].append(
+            _new_segment(dataset, save_folder, manifest["length"], length)
+        )
+        manifest["length"] = length
+        _write_manifest(save_folder, manifest)
+
+    # anything the manifest does not know of is left over from an interrupted build
+    recorded = {chunk["file"] for chunk in manifest["chunks"]}
+
+    for name in os.listdir(save_folder):
+        path = os.path.join(save_folder, name)
+
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        elif name.endswith((".tar", ".tar.gz", ".tmp")) and name not in recorded:
+            os.remove(path)
+
+    return manifest
+
+
+def _pending_ranges(manifest: dict) -> list[tuple[int, int]]:
+    ranges = []
+    position = 0
+
+    for chunk in sorted(manifest["chunks"], key=lambda x: x["start"]):
+        if chunk["start"] > position:
+            ranges.append((position, chunk["start"]))
+        position = chunk["end"]
+
+    if position < manifest["length"]:
+        ranges.append((position, manifest["length"]))
+
+    return ranges
+
+
+def _split_ranges(
+    ranges: list[tuple[int, int]], num_workers: int
+) -> list[tuple[int, int]]:
+    total = sum(end - start for start, end in ranges)
+    size = max(int(np.ceil(total / max(num_workers, 1))), 1)
+
+    return [
+        (i, min(i + size, end))
+        for start, end in ranges
+        for i in range(start, end, size)
+    ]
+
+
+def _finalize_build(save_folder: str) -> dict:
+    with _build_lock(save_folder):
+        manifest = read_manifest(save_folder)
+        manifest["chunks"].sort(key=lambda x: x["start"])
+
+        # chunks are numbered by the positions they hold, so chunks of an earlier
+        # build keep their numbers and appended chunks are numbered after them
+        for number, chunk in enumerate(manifest["chunks"]):
+            extension = chunk["file"].split(".", 1)[1]
+            file_name = f"dataset-{number}-{chunk['sample_count']}.{extension}"
+
+            if chunk["file"] != file_name:
+                os.replace(
+                    os.path.join(save_folder, chunk["file"]),
+                    os.path.join(save_folder, file_name),
+                )
+
+            chunk["number"] = number
+            chunk["file"] = file_name
+
+        _write_manifest(save_folder, manifest)
+
+    return manifest
+
+
+def _finish_chunk(
+    dataset: ProcessorDataset,
+    save_folder: str,
+    start: int,
+    end: int,
+    compressor: _ChunkCompressor,
+    chunk_format: str,
+):
+    with open(os.path.join(dataset.prefix, "ann.json"), "w") as f:
+        ann_list = []
+        for name, tag in dataset.save_savers():
+            ann_list.append((name, tag))
+        json.dump(ann_list, f)
+
+    file_name = f"chunk-{start}.{chunk_format}"
+
+    # the savers are reset for the next chunk, so only compression is left to run
+    # in the background, the chunk is recorded as done once it is compressed
+    dataset.close_savers()
+    compressor.submit(
+        dataset.prefix,
+        os.path.join(save_folder, file_name),
+        functools.partial(
+            _record_chunk,
+            save_folder,
+            file_name,
+            start,
+            end,
+            [tag for _, tag in ann_list],
+        ),
+    )
+
+
 # TODO: Consider refactoring this function since it's too complex (C901) -> https://www.flake8rules.com/rules/C901.html
 # flake8: noqa: C901
-def save_file_and_label(
-    dataset: ProcessorDataset, ds_name: str, check=100
+def _build_shard(
+    dataset: ProcessorDataset,
+    save_folder: str,
+    segments: list[dict],
+    start: int,
+    stop: int,
+    check=100,
+    position=0,
+    chunk_format="tar.gz",
 ):  # noqa C901
-    cwd = os.getcwd()
-    save_folder = os.path.join(cwd, "ProjectDatasets", ds_name)
-
-    if os.path.isdir(save_folder):
-        raise UploadError("Folder already exists")
-    else:
-        os.makedirs(save_folder)
+    """
+    Processes a range of the processing order of a dataset into compressed chunks
+
+    :param dataset: the dataset to process
+    :param save_folder: the folder the chunks are written to
+    :param segments: the segments of the build manifest, describing the order
+    :param start: the first position in the processing order to process
+    :param stop: the position to stop before
+    :param check: after how many samples the size of savers that do not keep count of
+        their own size is measured
+    :param position: the line the progress bar is drawn on
+    :param chunk_format: tar or tar.gz, the container chunks are written as
+    """
+    scratch_folder = os.path.join(save_folder, f"build-{start}")
+    os.mkdir(scratch_folder)
+
+    indices = _order_range(segments, start, stop)
+    progress = tqdm(colour="blue", position=position, total=stop - start)
 
     current_file_size = 0
     file_count = 0
@@ -228,68 +668,289 @@ def save_file_and_label(
     chunk_num = 0
     mult = None
     f_mult = None
+    per_sample = None
+
+    with _ChunkCompressor() as compressor:
+        _start_chunk(dataset, scratch_folder, chunk_num)
+
+        # savers that keep count of their size let chunks be cut on an exact budget,
+        # otherwise the size is extrapolated from the chunk on disk after `check` samples
+        usage = dataset.saver_usage()
+        tracked = usage is not None
+
+        while True:
+            size = _batch_size(dataset, count, check, usage, per_sample)
+            batch = list(itertools.islice(indices, size))
+
+            if not batch:
+                break
+
+            dataset.get_batch(batch)
+            progress.update(len(batch))
+
+            count += len(batch)
+            temp_count += len(batch)
+
+            if tracked:
+                nbytes, n_files = dataset.saver_usage()
+                per_sample = (
+                    (nbytes - usage[0]) / len(batch),
+                    (n_files - usage[1]) / len(batch),
+                )
+                usage = (nbytes, n_files)
+                full = nbytes > limit or n_files > file_limit
+            else:
+                full = current_file_size > limit or file_count > file_limit
+
+                if not full:
+                    if count == check:
+                        for _ in dataset.save_savers():
+                            pass
+
+                        mult = get_directory_size(dataset.prefix)
+                        f_mult = get_total_file_count(dataset.prefix)
+
+                    if mult:
+                        if count % check == 0:
+                            current_file_size += mult
+
+                    if f_mult:
+                        if count % check == 0:
+                            file_count += f_mult
+
+            if full:
+                _finish_chunk(
+                    dataset,
+                    save_folder,
+                    start,
+                    start + temp_count,
+                    compressor,
+                    chunk_format,
+                )
+                start += temp_count
+                chunk_num += 1
+                temp_count = 0
+                _start_chunk(dataset, scratch_folder, chunk_num)
+                usage = dataset.saver_usage()
+                current_file_size = 0
+                file_count = 0
+
+        if temp_count:
+            _finish_chunk(
+                dataset,
+                save_folder,
+                start,
+                start + temp_count,
+                compressor,
+                chunk_format,
+            )
+        else:
+            # the last sample filled the previous chunk, nothing is left for this one
+            dataset.close_savers()
 
-    os.mkdir(os.path.join(save_folder, f"dataset-{chunk_num}"))
-    dataset.prefix = os.path.join(save_folder, f"dataset-{chunk_num}")
-    dataset.prepare()
+    progress.close()
+    shutil.rmtree(scratch_folder)
 
-    for _ in tqdm(dataset, colour="blue"):
-        count += 1
-        temp_count += 1
 
-        if current_file_size <= limit and file_count <= file_limit:
-            if count == check:
-                for _ in dataset.save_savers():
-                    pass
+def _batch_size(
+    dataset: ProcessorDataset,
+    count: int,
+    check: int,
+    usage: tuple[int, int] | None,
+    per_sample: tuple[float, float] | None,
+) -> int:
+    if dataset.batch_size == 1:
+        return 1
 
-                mult = get_directory_size(dataset.prefix)
-                f_mult = get_total_file_count(dataset.prefix)
+    if usage is None:
+        # batches end where the size of untracked savers is measured
+        return min(dataset.batch_size, check - count % check)
 
-            if mult:
-                if count % check == 0:
-                    current_file_size += mult
+    if per_sample is None:
+        # a single sample measures how much room a sample takes up
+        return 1
 
-            if f_mult:
-                if count % check == 0:
-                    file_count += f_mult
+    # enough samples to fill the chunk, plus the sample that crosses the limit
+    room = [(limit - usage[0]) / max(per_sample[0], 1)]
+    if per_sample[1] > 0:
+        room.append((file_limit - usage[1]) / per_sample[1])
 
-        else:
-            with open(os.path.join(dataset.prefix, "ann.json"), "w") as f:
-                ann_list = []
-                for name, tag in dataset.save_savers():
-                    ann_list.append((name, tag))
-                json.dump(ann_list, f)
-
-            compress_directory(
-                dataset.prefix,
-                os.path.join(save_folder, f"dataset-{chunk_num}-{temp_count}.tar.gz"),
-            )
-            chunk_num += 1
-            temp_count = 0
-            os.mkdir(os.path.join(save_folder, f"dataset-{chunk_num}"))
-            dataset.prefix = os.path.join(save_folder, f"dataset-{chunk_num}")
-            dataset.reset_savers()
-            dataset.prepare()
-            current_file_size = 0
-            file_count = 0
+    return int(min(dataset.batch_size, max(min(room), 0) + 1))
 
-    with open(os.path.join(dataset.prefix, "ann.json"), "w") as f:
-        ann_list = []
-        for name, tag in dataset.save_savers():
-            ann_list.append((name, tag))
 
-        json.dump(ann_list, f)
+_build_dataset = None
 
-    compress_directory(
-        dataset.prefix,
-        os.path.join(save_folder, f"dataset-{chunk_num}-{temp_count}.tar.gz"),
+
+def _init_build_worker(dataset: ProcessorDataset):
+    # the dataset is sent to each worker once instead of with every shard
+    global _build_dataset
+    _build_dataset = dataset
+
+    # a forked worker inherits the thread pools of the savers without their threads
+    savers = dataset._get_savers()
+    for saver in savers if isinstance(savers, tuple) else (savers,):
+        if isinstance(saver, RawFile):
+            saver._executor = None
+            saver._lock = threading.Lock()
+
+
+def _build_worker_shard(
+    save_folder: str,
+    segments: list[dict],
+    start: int,
+    stop: int,
+    check: int,
+    position: int,
+    chunk_format: str,
+):
+    _build_shard(
+        _build_dataset,
+        save_folder,
+        segments,
+        start,
+        stop,
+        check,
+        position,
+        chunk_format,
     )
 
-    return count
+
+def _get_mp_context():
+    # the platform default, fork is not safe on macOS so spawn is used there and the
+    # dataset is pickled once per worker by the initializer
+    return multiprocessing.get_context()
+
+
+def save_file_and_label(
+    dataset: ProcessorDataset,
+    ds_name: str,
+    check=100,
+    num_workers: int = 1,
+    resume: bool = False,
+    chunk_format: str = "tar.gz",
+) -> int:
+    """
+    Processes a dataset into compressed chunks under ProjectDatasets/<ds_name>
+
+    :param dataset: the dataset to process
+    :param ds_name: the name of the dataset
+    :param check: after how many samples the size of savers that do not keep count of
+        their own size is measured
+    :param num_workers: how many processes build chunks in parallel, each process
+        handles a contiguous shard of the processing order, which is computed lazily
+        from the seeds in the manifest
+    :param resume: continue the build recorded in the manifest of an existing folder,
+        chunks that are done are kept and indices past the recorded length of the
+        dataset are added as new chunks
+    :param chunk_format: tar.gz compresses the chunks, tar writes them uncompressed
+        so loaders read them in place, which suits data that compresses poorly
+    :return: the number of samples in the build
+    """
+    if chunk_format not in ("tar", "tar.gz"):
+        raise ValueError("chunk_format must be tar or tar.gz")
+
+    cwd = os.getcwd()
+    save_folder = os.path.join(cwd, "ProjectDatasets", ds_name)
+
+    if os.path.isdir(save_folder):
+        if not resume:
+            raise UploadError("Folder already exists")
+
+        if os.listdir(save_folder) and not os.path.isfile(manifest_path(save_folder)):
+            raise UploadError("Folder has no build manifest to resume from")
+    else:
+        os.makedirs(save_folder)
+
+    with _build_lock(save_folder):
+        manifest = _prepare_build(dataset, save_folder)
+
+    segments = manifest["segments"]
+    shards = _split_ranges(_pending_ranges(manifest), num_workers)
+
+    if num_workers <= 1:
+        for start, end in shards:
+            _build_shard(
+                dataset,
+                save_folder,
+                segments,
+                start,
+                end,
+                check,
+                chunk_format=chunk_format,
+            )
+    else:
+        with ProcessPoolExecutor(
+            num_workers,
+            mp_context=_get_mp_context(),
+            initializer=_init_build_worker,
+            initargs=(dataset,),
+        ) as pool:
+            futures = [
+                pool.submit(
+                    _build_worker_shard,
+                    save_folder,
+                    segments,
+                    start,
+                    end,
+                    check,
+                    i % num_workers,
+                    chunk_format,
+                )
+                for i, (start, end) in enumerate(shards)
+            ]
+
+            for future in futures:
+                future.result()
+
+    return _finalize_build(save_folder)["length"]
+
+
+def chunk_digest(directory_path: str, chunk_format: str = "tar.gz") -> str:
+    """
+    Hashes the content of an uncompressed chunk. Savers name their files randomly, so
+    the names are replaced by the position of the saver in ann.json, two chunks holding
+    the same samples in the same order get the same hash.
+
+    :param directory_path: the folder of the chunk, holding ann.json
+    :param chunk_format: the archive format the chunk is stored in, chunks of another
+        format get another hash since their uploaded objects differ
+    :return: the hex digest
+    """
+    with open(os.path.join(directory_path, "ann.json")) as f:
+        ann_list = json.load(f)
+
+    aliases = {name: f"saver-{i}" for i, (name, _) in enumerate(ann_list)}
+
+    digest = hashlib.blake2b()
+    digest.update(chunk_format.encode() + b"\0")
+    digest.update(json.dumps([tag for _, tag in ann_list]).encode())
+
+    entries = []
+    for dir_path, _, filenames in os.walk(directory_path):
+        for f in filenames:
+            path = os.path.join(dir_path, f)
+            relative = os.path.relpath(path, directory_path)
+
+            if relative == "ann.json":
+                continue
+
+            for name, alias in aliases.items():
+                relative = relative.replace(name, alias)
+
+            entries.append((relative, path))
+
+    for relative, path in sorted(entries):
+        digest.update(relative.encode() + b"\0")
+
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(megabyte), b""):
+                digest.update(block)
+
+    return digest.hexdigest()
 
 
-def compress_directory(directory_path, output_filename):
-    with tarfile.open(output_filename, "w:gz") as tar:
+def compress_directory(directory_path, output_filename, compress=True):
+    with tarfile.open(output_filename, "w:gz" if compress else "w") as tar:
         tar.add(directory_path, arcname="")
 
     shutil.rmtree(directory_path)
@@ -308,11 +969,10 @@ def get_dir_size(path) -> int:
 
 
 def iterate_directory(file_dir: str, current_file: int) -> tuple[str, bool]:
-    dir_list = sorted(os.listdir(file_dir), key=lambda x: x.split("-")[1])
+    chunks = ChunkIndex.from_folder(file_dir).chunks
 
-    for idx, i in enumerate(dir_list):
-        if idx >= current_file:
-            yield str(pathlib.Path(file_dir).resolve() / i)
+    for i in chunks[current_file:]:
+        yield str(pathlib.Path(i).resolve())
 
 
 def create_dataset_dir():
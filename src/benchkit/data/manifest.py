@@ -0,0 +1,234 @@
+import bisect
+import hashlib
+import itertools
+import json
+import os
+
+
+def manifest_path(save_folder: str) -> str:
+    return os.path.join(save_folder, "manifest.json")
+
+
+def read_manifest(save_folder: str) -> dict:
+    """
+    Reads the manifest of a processed dataset
+
+    :param save_folder: the folder holding the chunks
+    :return: a dictionary containing the manifest
+
+    The dictionary contains the following keys:
+    - 'length': (int) how many samples the build covers
+    - 'segments': (list) a dict per build that added indices, with the keys 'start',
+      'stop', 'ordering', 'seed' and 'block_size', describing the order the indices
+      from start to stop were processed in
+    - 'chunks': (list) a dict per chunk with the keys 'number', 'file',
+      'sample_count', 'start', 'end', 'size', 'tags', 'checksum' and 'hash'. Start and
+      end are the range of samples the chunk holds, size and checksum the byte size
+      and blake2b digest of the chunk file, tags the saver tags from ann.json and hash
+      the `chunk_digest` of its content. Chunks of an unfinished build have no number
+      yet
+    """
+    with open(manifest_path(save_folder)) as f:
+        return json.load(f)
+
+
+def file_checksum(path: str) -> str:
+    """
+    :param path: the file to hash
+    :return: the blake2b hex digest of the file
+    """
+    digest = hashlib.blake2b()
+
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1_024**2), b""):
+            digest.update(block)
+
+    return digest.hexdigest()
+
+
+class ChunkIndex:
+    """
+    Maps sample numbers to the chunk holding them, chunks are kept in number order and
+    looked up by bisecting the cumulative sample counts
+
+    :param chunks: the chunks, local paths or the dicts returned by get_ds_chunks
+    :param sample_counts: how many samples each chunk holds
+    :param sizes: the byte size of each chunk
+    """
+
+    def __init__(
+        self, chunks: list, sample_counts: list[int], sizes: list[int] | None = None
+    ):
+        self.chunks = chunks
+        self.offsets = list(itertools.accumulate(sample_counts, initial=0))
+        self.sizes = sizes
+
+    @classmethod
+    def from_folder(cls, save_folder: str):
+        """
+        Indexes the chunks of a local build, through its manifest if it has one.
+        Raises a RuntimeError for a build that was interrupted
+        """
+        if os.path.isfile(manifest_path(save_folder)):
+            chunks = read_manifest(save_folder)["chunks"]
+
+            # chunks are only numbered once the build has finished
+            if any(chunk["number"] is None for chunk in chunks):
+                raise RuntimeError(
+                    f"The build in {save_folder} has not finished, rerun it with "
+                    "--resume before reading or uploading it"
+                )
+
+            chunks = sorted(chunks, key=lambda x: x["number"])
+            return cls(
+                [os.path.join(save_folder, chunk["file"]) for chunk in chunks],
+                [chunk["sample_count"] for chunk in chunks],
+                [chunk["size"] for chunk in chunks],
+            )
+
+        # builds from before the manifest only carry the counts in the file names
+        names = [
+            name
+            for name in os.listdir(save_folder)
+            if name.startswith("dataset-") and name.endswith(".tar.gz")
+        ]
+        names.sort(key=lambda x: int(x.split("-")[1]))
+
+        return cls(
+            [os.path.join(save_folder, name) for name in names],
+            [int(name.split("-")[2][: -len(".tar.gz")]) for name in names],
+            [os.path.getsize(os.path.join(save_folder, name)) for name in names],
+        )
+
+    @classmethod
+    def from_cloud(cls, chunk_list: list[dict]):
+        """
+        Indexes the chunks returned by get_ds_chunks
+        """
+        chunks = sorted(chunk_list, key=lambda x: x["number"])
+        return cls(
+            chunks,
+            [chunk["file_count"] for chunk in chunks],
+            [chunk["size"] for chunk in chunks],
+        )
+
+    def __len__(self):
+        return len(self.chunks)
+
+    @property
+    def sample_count(self) -> int:
+        return self.offsets[-1]
+
+    def locate(self, sample: int) -> tuple[int, int]:
+        """
+        :param sample: the number of a sample in the dataset
+        :return: the position of the chunk holding the sample, and the index of the
+            sample within the chunk
+        """
+        if not 0 <= sample < self.sample_count:
+            raise IndexError(f"sample {sample} is not in the dataset")
+
+        position = bisect.bisect_right(self.offsets, sample) - 1
+        return position, sample - self.offsets[position]
+
+    def sample_range(self, position: int) -> tuple[int, int]:
+        """
+        :param position: the position of a chunk
+        :return: the first sample of the chunk, and the sample after its last
+        """
+        return self.offsets[position], self.offsets[position + 1]
+
+    def pieces(self, start: int, stop: int) -> list[tuple[int, int, int]]:
+        """
+        :param start: the first sample
+        :param stop: the sample to stop before
+        :return: a (position, start, stop) tuple per chunk holding samples from start
+            to stop, with the samples of the chunk that fall in the range
+        """
+        if start >= stop:
+            return []
+
+        first, _ = self.locate(start)
+        last, _ = self.locate(stop - 1)
+
+        return [
+            (
+                position,
+                max(start, self.offsets[position]),
+                min(stop, self.offsets[position + 1]),
+            )
+            for position in range(first, last + 1)
+        ]
+
+    def weight(self, piece: tuple[int, int, int], by: str = "samples") -> float:
+        """
+        :param piece: a (position, start, stop) tuple returned by pieces
+        :param by: weigh the piece by its 'samples' or 'bytes', a piece holding part of
+            a chunk weighs in with the bytes of its share of the samples
+        :return: the weight of the piece
+        """
+        position, start, stop = piece
+
+        if by == "samples":
+            return stop - start
+
+        if by == "bytes":
+            chunk_start, chunk_stop = self.sample_range(position)
+            return self.sizes[position] * (stop - start) / (chunk_stop - chunk_start)
+
+        raise ValueError(f"Cannot weigh chunks by {by}")
+
+
+def balanced_split(weights: list[float], parts: int) -> list[int]:
+    """
+    Splits a run of weighted items into parts of consecutive items, each cut is placed
+    at the item boundary closest to an even share of the total weight
+
+    :param weights: the weight of each item
+    :param parts: how many parts to split the items into
+    :return: parts + 1 item positions, part i holds the items from cuts[i] to
+        cuts[i + 1]. Parts are empty when there are fewer items than parts
+    """
+    cumulative = list(itertools.accumulate(weights, initial=0))
+    cuts = [0]
+
+    for part in range(1, parts):
+        target = cumulative[-1] * part / parts
+        closest = bisect.bisect_left(cumulative, target)
+
+        if closest > 0 and (
+            target - cumulative[closest - 1] <= cumulative[closest] - target
+        ):
+            closest -= 1
+
+        cuts.append(closest)
+
+    return cuts + [len(weights)]
+
+
+def slice_pieces(
+    pieces: list[tuple[int, int, int]], start: int, stop: int
+) -> list[tuple[int, int, int]]:
+    """
+    Cuts a window out of the samples held by a run of pieces, see ChunkIndex.pieces
+
+    :param pieces: the pieces, their samples are counted one piece after another
+    :param start: the first sample of the window
+    :param stop: the sample to stop before
+    :return: the pieces holding the samples of the window
+    """
+    sliced = []
+    offset = 0
+
+    for position, piece_start, piece_stop in pieces:
+        count = piece_stop - piece_start
+        lo, hi = max(start - offset, 0), min(stop - offset, count)
+
+        if lo < hi:
+            sliced.append((position, piece_start + lo, piece_start + hi))
+
+        offset += count
+        if offset >= stop:
+            break
+
+    return sliced
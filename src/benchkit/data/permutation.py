@@ -0,0 +1,188 @@
+import copy
+
+import numpy as np
+
+_BATCH_SIZE = 65_536
+
+
+class IndexPermutation:
+    """
+    A seeded pseudo-random permutation of range(offset, offset + length), computed on
+    demand in constant memory. Positions are encrypted with a Feistel network over the
+    smallest power of 4 covering the length, values that fall outside the length are
+    encrypted again (cycle walking) until they land inside it. Slicing returns a lazy
+    view, so the same permutation can be shared out among workers.
+
+    :param length: how many indices to permute
+    :param seed: seeds the round keys, None picks a random permutation
+    :param offset: the first index of the permuted range
+    :param rounds: how many Feistel rounds are applied
+    """
+
+    def __init__(
+        self, length: int, seed: int | None = None, offset: int = 0, rounds: int = 6
+    ):
+        self.length = length
+        self.offset = offset
+
+        bits = max(int(length - 1).bit_length(), 2)
+        self._half = np.uint64((bits + 1) // 2)
+        self._mask = np.uint64((1 << int(self._half)) - 1)
+        self._keys = np.random.default_rng(seed).integers(
+            0, 2**63, size=rounds, dtype=np.uint64
+        )
+        self._window = range(length)
+
+    def _round(self, right: np.ndarray, key: np.uint64) -> np.ndarray:
+        # splitmix64 finalizer, uint64 arrays wrap around on overflow
+        x = (right ^ key) * np.uint64(0x9E3779B97F4A7C15)
+        x ^= x >> np.uint64(31)
+        x *= np.uint64(0xBF58476D1CE4E5B9)
+        x ^= x >> np.uint64(29)
+        return x & self._mask
+
+    def _encrypt(self, x: np.ndarray) -> np.ndarray:
+        left, right = x >> self._half, x & self._mask
+        for key in self._keys:
+            left, right = right, left ^ self._round(right, key)
+        return (left << self._half) | right
+
+    def _decrypt(self, x: np.ndarray) -> np.ndarray:
+        left, right = x >> self._half, x & self._mask
+        for key in self._keys[::-1]:
+            left, right = right ^ self._round(left, key), left
+        return (left << self._half) | right
+
+    def _walk(self, x: np.ndarray, step) -> np.ndarray:
+        x = step(x.astype(np.uint64))
+        outside = x >= self.length
+
+        while outside.any():
+            x[outside] = step(x[outside])
+            outside = x >= self.length
+
+        return x.astype(np.int64)
+
+    def _permute(self, positions: np.ndarray) -> np.ndarray:
+        return self._walk(positions, self._encrypt)
+
+    def _invert(self, values: np.ndarray) -> np.ndarray:
+        return self._walk(values, self._decrypt)
+
+    def __len__(self):
+        return len(self._window)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            view = copy.copy(self)
+            view._window = self._window[key]
+            return view
+
+        if isinstance(key, (int, np.integer)):
+            return int(self._permute(np.array([self._window[key]]))[0]) + self.offset
+
+        key = np.asarray(key, dtype=np.int64)
+        if ((key < -len(self)) | (key >= len(self))).any():
+            raise IndexError("permutation index out of range")
+
+        key = np.where(key < 0, key + len(self), key)
+        positions = self._window.start + key * self._window.step
+        return self._permute(positions) + self.offset
+
+    def __iter__(self):
+        for i in range(0, len(self._window), _BATCH_SIZE):
+            positions = np.asarray(self._window[i : i + _BATCH_SIZE])
+            yield from (self._permute(positions) + self.offset).tolist()
+
+    def __array__(self, dtype=None, copy=None):
+        values = self._permute(np.asarray(self._window)) + self.offset
+        return values if dtype is None else values.astype(dtype)
+
+    def index(self, value: int) -> int:
+        """
+        :param value: one of the permuted indices
+        :return: the position of the index in the permutation
+        """
+        if not self.offset <= value < self.offset + self.length:
+            raise ValueError(f"{value} is not in the permutation")
+
+        position = int(self._invert(np.array([value - self.offset]))[0])
+        return self._window.index(position)
+
+
+class BlockPermutation(IndexPermutation):
+    """
+    Permutes blocks of `block_size` consecutive indices, keeping indices sequential
+    within a block. The blocks are shuffled with an IndexPermutation, the last block
+    may be shorter than the others.
+
+    :param length: how many indices to permute
+    :param block_size: how many consecutive indices make up a block
+    :param seed: seeds the permutation of the blocks, None picks a random order
+    :param offset: the first index of the permuted range
+    """
+
+    def __init__(
+        self, length: int, block_size: int, seed: int | None = None, offset: int = 0
+    ):
+        super().__init__(length, seed=seed, offset=offset)
+        self.block_size = block_size
+
+        block_count = -(-length // block_size)
+        self._blocks = IndexPermutation(block_count, seed=seed)
+        self._short = length - (block_count - 1) * block_size if block_count else 0
+        # the position the short last block is moved to, blocks after it start
+        # `block_size - short` positions early
+        self._short_slot = self._blocks.index(block_count - 1) if block_count else 0
+
+    def _permute(self, positions: np.ndarray) -> np.ndarray:
+        positions = np.asarray(positions, dtype=np.int64)
+        split = self._short_slot * self.block_size
+        after = positions >= split + self._short
+
+        # blocks placed after the short block start `block_size - short` positions
+        # early, shifting them back lines every full block up with block_size again
+        shifted = np.where(after, positions - self._short + self.block_size, positions)
+        slots, within = np.divmod(shifted, self.block_size)
+
+        in_short = (positions >= split) & ~after
+        slots = np.where(in_short, self._short_slot, slots)
+        within = np.where(in_short, positions - split, within)
+
+        return self._blocks._permute(slots) * self.block_size + within
+
+    def _invert(self, values: np.ndarray) -> np.ndarray:
+        blocks, within = np.divmod(np.asarray(values, dtype=np.int64), self.block_size)
+        slots = self._blocks._invert(blocks)
+
+        shift = np.where(slots > self._short_slot, self.block_size - self._short, 0)
+        return slots * self.block_size - shift + within
+
+
+def make_order(
+    ordering: str,
+    start: int,
+    stop: int,
+    seed: int | None = None,
+    block_size: int = 1024,
+) -> range | IndexPermutation:
+    """
+    Builds the lazy order indices of a ProcessorDataset are processed in
+
+    :param ordering: one of sequential, block or shuffle
+    :param start: the first index to order
+    :param stop: the index to stop before
+    :param seed: seeds the block and shuffle orderings
+    :param block_size: how many consecutive indices make up a block
+    :return: a sequence of the indices from start to stop
+    """
+    if ordering == "sequential":
+        return range(start, stop)
+
+    if ordering == "block":
+        return BlockPermutation(stop - start, block_size, seed=seed, offset=start)
+
+    if ordering == "shuffle":
+        return IndexPermutation(stop - start, seed=seed, offset=start)
+
+    raise ValueError(f"Unknown ordering {ordering}")
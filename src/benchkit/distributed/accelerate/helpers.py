@@ -4,14 +4,40 @@ from datetime import timezone
 from typing import Any
 
 from accelerate.accelerator import Accelerator
+from accelerate.data_loader import prepare_data_loader
+from torch.utils.data import DataLoader
 
 from .tracking.bench_tracker import BenchTracker
+from benchkit.data.datasets import IterableChunk
 from benchkit.tracking.graphs.base_graph import BenchGraph
 
 
+def prepare_chunk_dataloader(acc: Accelerator, dataloader: DataLoader) -> DataLoader:
+    """
+    Prepares a DataLoader reading an IterableChunk. The dataset shards the chunks
+    among the processes itself, so accelerate only moves the batches to the device
+    instead of dispatching them from the main process
+
+    :param acc: the accelerator of the run
+    :param dataloader: the DataLoader of the IterableChunk
+    :return: the prepared DataLoader
+    """
+    dataloader.dataset.set_rank(acc.process_index, acc.num_processes)
+
+    return prepare_data_loader(
+        dataloader,
+        acc.device,
+        num_processes=1,
+        process_index=0,
+        put_on_device=acc.device_placement,
+        dispatch_batches=False,
+    )
+
+
 def get_bench_accelerator(*args, **kwargs) -> tuple[Accelerator, ...]:
     """
-    Prepares all relevant objects and initializes a bench accelerator
+    Prepares all relevant objects and initializes a bench accelerator, DataLoaders
+    reading an IterableChunk are prepared with prepare_chunk_dataloader
 
     :param args: All the objects you wish to pass into Accelerator.prepare()
     :param kwargs: All the arguments you want to pass into the `BenchAccelerator`
@@ -21,7 +47,21 @@ def get_bench_accelerator(*args, **kwargs) -> tuple[Accelerator, ...]:
 
     acc = Accelerator(**kwargs)
 
-    return acc, *acc.prepare(*args)
+    chunk_loaders = {
+        i
+        for i, obj in enumerate(args)
+        if isinstance(obj, DataLoader) and isinstance(obj.dataset, IterableChunk)
+    }
+    rest = [obj for i, obj in enumerate(args) if i not in chunk_loaders]
+
+    # prepare hands back a lone object instead of a tuple of one
+    prepared = acc.prepare(*rest) if rest else ()
+    prepared = iter((prepared,) if len(rest) == 1 else prepared)
+
+    return acc, *[
+        prepare_chunk_dataloader(acc, obj) if i in chunk_loaders else next(prepared)
+        for i, obj in enumerate(args)
+    ]
 
 
 def get_accelerator_with_bench_tracker(
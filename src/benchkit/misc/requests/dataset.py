@@ -116,15 +116,21 @@ def get_chunk_count(dataset_id: str) -> int:
 
 
 def get_post_url(
-    dataset_id: str, file_size: int, file_path: str, file_count: int
+    dataset_id: str,
+    file_size: int,
+    file_path: str,
+    file_count: int,
+    content_hash: str | None = None,
 ) -> Response:
     """
     gives a presigned post URL, this URL should be used for uploading chunks
 
     :param dataset_id: the uuid of the dataset
-    :param file_size: the size in bytes of the chunk gzip
-    :param file_path: where the chunk gzip is located
+    :param file_size: the size in bytes of the chunk archive
+    :param file_path: where the chunk archive is located
     :param file_count: the current number of the chunk, used for ordering the chunks
+    :param content_hash: the content hash of the chunk, lets later uploads of the same
+        content be skipped
     :return: response object containing a dictionary
 
     The dictionary contains the following keys:
@@ -141,6 +147,50 @@ def get_post_url(
             "size": file_size,
             "file_key": file_path,
             "file_count": file_count,
+            "content_hash": content_hash,
+        },
+    )
+
+    return response
+
+
+def get_existing_chunk_hashes(hashes: list[str]) -> list[str]:
+    """
+    tells you which chunk contents have already been uploaded to the project
+
+    :param hashes: the content hashes of the chunks
+    :return: the hashes that are already present
+    """
+    request_url = "/".join([get_main_url(), "api", "dataset", "chunk", "hash"])
+
+    response = request_executor("post", url=request_url, json={"hashes": hashes})
+
+    return json.loads(response.content)["hashes"]
+
+
+def link_chunk(
+    dataset_id: str, content_hash: str, file_path: str, file_count: int
+) -> Response:
+    """
+    adds a chunk to a dataset, reusing content that was already uploaded to the
+    project instead of uploading it again
+
+    :param dataset_id: the uuid of the dataset
+    :param content_hash: the content hash of the uploaded chunk
+    :param file_path: the name of the chunk archive
+    :param file_count: the current number of the chunk, used for ordering the chunks
+    :return: response object containing a dictionary with the chunk metadata
+    """
+    request_url = "/".join([get_main_url(), "api", "dataset", "chunk", "link"])
+
+    response = request_executor(
+        "post",
+        url=request_url,
+        json={
+            "dataset_id": dataset_id,
+            "content_hash": content_hash,
+            "file_key": file_path,
+            "file_count": file_count,
         },
     )
 
@@ -174,7 +224,7 @@ def delete_dataset(dataset_id: str) -> Response:
 
 def get_get_url(chunk_id: str) -> str:
     """
-    returns a presigned get url that acquires the chunk gzip
+    returns a presigned get url that acquires the chunk archive
 
     :param chunk_id: the UUID of the dataset chunk
     :return: the get url
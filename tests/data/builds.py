@@ -0,0 +1,89 @@
+import os
+
+import numpy as np
+
+from benchkit.data import BaseFile
+from benchkit.data import datasets
+from benchkit.data import IterableChunk
+from benchkit.data import NumpyFile
+from benchkit.data import ProcessorDataset
+from benchkit.data.manifest import read_manifest
+
+
+class FixedSizeProcessor(ProcessorDataset):
+    def __init__(self, length=250):
+        super().__init__()
+        self.np1 = NumpyFile(enforce_shape=True, shape=(125,))
+        self.length = length
+
+    def _get_savers(self) -> tuple[BaseFile, ...] | BaseFile:
+        return self.np1
+
+    def __len__(self):
+        return self.length
+
+    def _get_data(self, idx: int):
+        self.np1.append(np.full(125, idx, dtype=np.float64))
+
+
+class FakeDownload:
+    def __init__(self, path):
+        self.path = path
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, chunk_size):
+        with open(self.path, "rb") as f:
+            yield from iter(lambda: f.read(chunk_size), b"")
+
+
+def fake_cloud(monkeypatch, save_folder: str) -> list[str]:
+    """
+    Serves the chunks of a local build as if they were uploaded, the returned list
+    collects the ids of the chunks downloaded
+    """
+    downloads = []
+    chunks = {
+        str(chunk["number"]): chunk for chunk in read_manifest(save_folder)["chunks"]
+    }
+
+    def get_download(url, stream=False):
+        downloads.append(url)
+        return FakeDownload(os.path.join(save_folder, chunks[url]["file"]))
+
+    monkeypatch.setattr(datasets, "get_get_url", lambda chunk_id: chunk_id)
+    monkeypatch.setattr(datasets.requests, "get", get_download)
+    monkeypatch.setattr(
+        datasets,
+        "get_ds_chunks",
+        lambda dataset_id: [
+            {
+                "id": chunk_id,
+                "number": chunk["number"],
+                "size": chunk["size"],
+                "file_count": chunk["sample_count"],
+                "location": chunk["file"],
+                "dataset_id": dataset_id,
+            }
+            for chunk_id, chunk in chunks.items()
+        ],
+    )
+
+    return downloads
+
+
+def cloud_chunker(length: int) -> IterableChunk:
+    chunker = IterableChunk()
+    chunker._cloud = True
+    chunker._dataset_id = "dataset"
+    chunker.end_index = length
+    chunker.length = length
+
+    return chunker
@@ -0,0 +1,26 @@
+import pytest
+
+from benchkit.data import helpers
+from benchkit.data import save_file_and_label
+from tests.data.builds import FixedSizeProcessor
+
+
+@pytest.fixture
+def small_build(tmp_path, monkeypatch):
+    """
+    Builds datasets under ProjectDatasets in tmp_path, which becomes the working
+    directory. Chunks are closed at 100_000 bytes, so the 1_000 byte samples of a
+    FixedSizeProcessor are cut into chunks of 100 samples. Call it with the name of
+    the dataset and its length, or pass a dataset of your own
+    """
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(helpers, "limit", 100 * 1_000)
+
+    def build(name: str, length: int = 250, dataset=None, **kwargs) -> int:
+        if dataset is None:
+            dataset = FixedSizeProcessor(length)
+            dataset.ordering = "sequential"
+
+        return save_file_and_label(dataset, ds_name=name, **kwargs)
+
+    return build
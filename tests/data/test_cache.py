@@ -0,0 +1,74 @@
+import os
+import subprocess  # noqa S404
+import sys
+from pathlib import Path
+
+import pytest
+
+from benchkit.data import ChunkCache
+from tests.data.builds import cloud_chunker
+from tests.data.builds import fake_cloud
+
+
+def test_chunk_cache_keeps_chunks_across_epochs(tmp_path, monkeypatch, small_build):
+    small_build("cached")
+    downloads = fake_cloud(monkeypatch, os.path.join("ProjectDatasets", "cached"))
+
+    chunker = cloud_chunker(250)
+    chunker.cache = ChunkCache(str(tmp_path / "cache"), 1_024**3)
+
+    for _ in range(2):
+        assert [float(i[0]) for i in chunker] == list(range(250))
+
+    # every chunk is downloaded once, and kept unpacked
+    assert sorted(downloads) == ["0", "1", "2"]
+    assert not [i for i in os.listdir(tmp_path) if i.startswith("Temp-")]
+
+    # a budget below one chunk keeps only the chunks being read
+    downloads.clear()
+    chunker.cache = ChunkCache(str(tmp_path / "small-cache"), 1)
+
+    for _ in range(2):
+        assert [float(i[0]) for i in chunker] == list(range(250))
+
+    assert len(downloads) == 6
+    assert chunker.cache.size() == 0
+
+
+def test_chunk_cache_pins_of_other_processes(tmp_path):
+    pytest.importorskip("fcntl")
+
+    def fill(folder):
+        Path(folder, "rows").write_bytes(bytes(10))
+
+    # another process pins an entry, and dies without releasing it
+    reader = subprocess.Popen(  # noqa S603
+        [
+            sys.executable,
+            "-c",
+            "import sys\n"
+            "from benchkit.data import ChunkCache\n"
+            "cache = ChunkCache(sys.argv[1], 1)\n"
+            "cache.acquire('a', lambda f: open(f + '/rows', 'wb').write(bytes(10)))\n"
+            "print('pinned', flush=True)\n"
+            "sys.stdin.read()\n",
+            str(tmp_path),
+        ],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    assert reader.stdout.readline() == "pinned\n"
+
+    cache = ChunkCache(str(tmp_path), 1)
+    cache.acquire("b", fill)
+    assert cache.size() == 20
+
+    cache.release("b")
+    assert cache.size() == 10
+
+    reader.kill()
+    reader.wait()
+
+    cache.release("a")
+    assert cache.size() == 0
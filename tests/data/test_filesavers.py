@@ -1,11 +1,15 @@
+import copy
+import json
 import os
 import random
 import shutil
 import uuid
 from pathlib import Path
+from types import SimpleNamespace
 
 import numpy as np
 import pandas as pd
+import pytest
 import torch
 from tqdm import tqdm
 
@@ -21,6 +25,12 @@ from benchkit.data import RawFile
 from benchkit.data import save_file_and_label
 from benchkit.data import TextFile
 from benchkit.data import TorchFile
+from benchkit.data import datasets
+from benchkit.data import helpers
+from benchkit.data.manifest import file_checksum
+from tests.data.builds import cloud_chunker
+from tests.data.builds import fake_cloud
+from tests.data.builds import FixedSizeProcessor
 
 
 class CsvFile(BaseFile):
@@ -252,3 +262,658 @@ def test_one_file_saver():
 
 def test_custom_file_saver():
     custom_file_saver()
+
+
+def test_enforced_numpy_file_growth(tmp_path):
+    saver = NumpyFile(enforce_shape=True, shape=(2, 3))
+    saver.prefix = str(tmp_path)
+
+    for i in range(100):
+        saver.append(np.full((2, 3), i, dtype=np.int16))
+
+    saver.append(np.full((2, 3), 0.5, dtype=np.float32))
+
+    name, tag = saver.save()
+    loaded = NumpyFile.load(os.path.join(tmp_path, name), True, mmap=True)
+
+    assert tag == "enforced_arr"
+    assert isinstance(loaded.arr, np.memmap)
+    assert loaded.arr.shape == (101, 2, 3)
+    assert loaded.arr.dtype == np.float32
+    assert np.all(loaded(42) == 42)
+    assert np.all(loaded(100) == 0.5)
+    assert loaded.shape == (2, 3)
+
+    with pytest.raises(ValueError, match="shape"):
+        NumpyFile(enforce_shape=True)
+
+
+def test_torch_file_keeps_dtype(tmp_path):
+    saver = TorchFile(shape=(2, 2))
+    saver.prefix = str(tmp_path)
+
+    for i in range(10):
+        saver.append(torch.full((2, 2), i, dtype=torch.int32))
+
+    name, tag = saver.save()
+
+    for mmap in (False, True):
+        loaded = TorchFile.load(os.path.join(tmp_path, name), mmap=mmap)
+
+        assert tag == "ten"
+        assert loaded.ten.dtype == torch.int32
+        assert tuple(loaded.ten.size()) == (10, 2, 2)
+        assert torch.all(loaded(7) == 7)
+
+
+def test_ragged_numpy_file(tmp_path):
+    saver = NumpyFile(enforce_shape=False)
+    saver.prefix = str(tmp_path)
+
+    shapes = [(2, 3), (5,), (), (1, 4, 2)]
+    for i, shape in enumerate(shapes):
+        saver.append(np.full(shape, i, dtype=np.float32))
+
+    name, tag = saver.save()
+    loaded = NumpyFile.load(os.path.join(tmp_path, name), False, mmap=True)
+
+    # indexed access works in any order and any number of times
+    for _ in range(2):
+        for i in reversed(range(len(shapes))):
+            assert loaded(i).shape == shapes[i]
+            assert np.all(loaded(i) == i)
+
+
+def test_text_and_boolean_files(tmp_path):
+    text = TextFile()
+    boolean = BooleanFile()
+    text.prefix = boolean.prefix = str(tmp_path)
+
+    lines = ["plain", "ünïcödé ✓", "", "trailing newline\n"]
+    for idx, line in enumerate(lines):
+        text.append(line)
+        boolean.append(idx % 3 == 0)
+
+    text_name, _ = text.save()
+    bool_name, _ = boolean.save()
+
+    loaded_text = TextFile.load(os.path.join(tmp_path, text_name), mmap=True)
+    loaded_bool = BooleanFile.load(os.path.join(tmp_path, bool_name), mmap=True)
+
+    assert [loaded_text(i) for i in range(len(lines))] == [
+        "plain",
+        "ünïcödé ✓",
+        "",
+        "trailing newline",
+    ]
+    assert [loaded_bool(i) for i in range(len(lines))] == [True, False, False, True]
+
+
+def test_numeric_file_dtypes(tmp_path):
+    ints, floats, narrow = NumericFile(), NumericFile(), NumericFile(dtype=np.int8)
+
+    for saver in (ints, floats, narrow):
+        saver.prefix = str(tmp_path)
+
+    for i in range(10):
+        ints.append(i)
+        floats.append(i if i % 2 else i / 2)
+        narrow.append(-i)
+
+    loaded = [
+        NumericFile.load(os.path.join(tmp_path, saver.save()[0]), mmap=True)
+        for saver in (ints, floats, narrow)
+    ]
+
+    assert [saver.numeric_list.dtype for saver in loaded] == [
+        np.int64,
+        np.float64,
+        np.int8,
+    ]
+    assert isinstance(loaded[0](3), int) and loaded[0](3) == 3
+    assert isinstance(loaded[1](4), float) and loaded[1](4) == 2.0
+    assert loaded[2](9) == -9
+
+    # a fixed dtype never wraps or truncates a number
+    with pytest.raises(ValueError):
+        narrow.append(1_000)
+    with pytest.raises(ValueError):
+        narrow.append_batch([1, 2.5])
+    halves, strings = NumericFile(dtype=np.float16), NumericFile()
+    halves.prefix = strings.prefix = str(tmp_path)
+
+    with pytest.raises(ValueError):
+        halves.append(1e6)
+    with pytest.raises(ValueError):
+        strings.append("abc")
+
+
+def test_json_lines_file(tmp_path):
+    saver = JsonFile()
+    saver.prefix = str(tmp_path)
+
+    records = [{"id": i, "tags": ["a"] * i, "note": "line\nbreak"} for i in range(5)]
+    for record in records:
+        saver.append(record)
+
+    name, _ = saver.save()
+    loaded = JsonFile.load(os.path.join(tmp_path, name), mmap=True)
+
+    assert [loaded(i) for i in reversed(range(5))] == records[::-1]
+
+
+def test_raw_file_dedupe(tmp_path):
+    source = tmp_path / "source"
+    chunk = tmp_path / "chunk"
+    source.mkdir()
+    chunk.mkdir()
+
+    (source / "a.txt").write_text("same")
+    (source / "b.txt").write_text("same")
+    (source / "c.txt").write_text("different")
+
+    saver = RawFile(workers=4)
+    saver.prefix = str(chunk)
+
+    for name in ["a.txt", "b.txt", "a.txt", "c.txt", "b.txt"]:
+        saver.append(str(source / name))
+
+    name, tag = saver.save()
+    loaded = RawFile.load(os.path.join(chunk, name))
+
+    assert tag == "folder"
+    assert sorted(os.listdir(chunk / name)) == ["a.txt", "ann.json", "c.txt"]
+    assert [os.path.split(loaded(i))[-1] for i in range(5)] == [
+        "a.txt",
+        "a.txt",
+        "a.txt",
+        "c.txt",
+        "a.txt",
+    ]
+
+
+def test_packed_raw_file(tmp_path):
+    contents = [b"first", b"", b"first", os.urandom(3_000)]
+
+    for idx, content in enumerate(contents):
+        (tmp_path / f"{idx}.bin").write_bytes(content)
+
+    saver = RawFile(packed=True)
+    saver.prefix = str(tmp_path)
+
+    for idx in range(len(contents)):
+        saver.append(str(tmp_path / f"{idx}.bin"))
+
+    name, tag = saver.save()
+    save_path = os.path.join(tmp_path, name)
+
+    assert tag == "blob"
+    assert os.path.getsize(save_path) == len(b"first") + 3_000
+
+    loaded = RawFile.load(save_path, mmap=True)
+    assert [loaded(i) for i in range(len(contents))] == contents
+
+    loaded = RawFile.load(save_path, materialize=True)
+    assert Path(loaded(3)).read_bytes() == contents[3]
+
+
+def test_packed_raw_file_is_reproducible(tmp_path):
+    source = tmp_path / "source"
+    source.mkdir()
+
+    for idx in range(200):
+        (source / f"{idx}.bin").write_bytes(os.urandom(idx % 7 * 500) * (idx % 3))
+
+    digests = set()
+    for build in range(4):
+        chunk = tmp_path / f"chunk-{build}"
+        chunk.mkdir()
+
+        saver = RawFile(packed=True)
+        saver.prefix = str(chunk)
+
+        for idx in range(200):
+            saver.append(str(source / f"{idx}.bin"))
+
+        name, _ = saver.save()
+        saver.close()
+
+        digests.add(
+            (
+                file_checksum(os.path.join(chunk, name)),
+                file_checksum(os.path.join(chunk, name + ".index.json")),
+            )
+        )
+
+    # the blob is laid out in append order, whatever order the pool finished in
+    assert len(digests) == 1
+
+
+def test_raw_file_sources_can_be_removed(tmp_path):
+    for packed in (False, True):
+        chunk = tmp_path / f"chunk-{packed}"
+        chunk.mkdir()
+
+        saver = RawFile(packed=packed)
+        saver.prefix = str(chunk)
+
+        for idx in range(20):
+            source = tmp_path / f"{idx}.bin"
+            source.write_bytes(str(idx).encode())
+            saver.append(str(source))
+            source.unlink()
+
+        name, _ = saver.save()
+        loaded = RawFile.load(os.path.join(chunk, name), mmap=packed)
+
+        if packed:
+            assert sorted(os.listdir(chunk)) == [name, name + ".index.json"]
+            assert [loaded(i) for i in range(20)] == [
+                str(i).encode() for i in range(20)
+            ]
+        else:
+            assert [Path(loaded(i)).read_text() for i in range(20)] == [
+                str(i) for i in range(20)
+            ]
+
+
+def test_savers_stream_across_saves(tmp_path):
+    numeric = NumericFile()
+    boolean = BooleanFile()
+    tensor = TorchFile(shape=(2,))
+    savers = (numeric, boolean, tensor)
+
+    for saver in savers:
+        saver.prefix = str(tmp_path)
+
+    for i in range(21):
+        # a save halfway through must not stop later appends from landing
+        if i == 11:
+            for saver in savers:
+                saver.save()
+
+        numeric.append(i if i < 15 else i + 0.5)
+        boolean.append(i % 3 == 0)
+        tensor.append(torch.full((2,), i, dtype=torch.int8 if i < 5 else torch.int32))
+
+    paths = [os.path.join(tmp_path, saver.save()[0]) for saver in savers]
+
+    for saver in savers:
+        saver.close()
+
+    loaded_numeric = NumericFile.load(paths[0])
+    loaded_bool = BooleanFile.load(paths[1])
+    loaded_tensor = TorchFile.load(paths[2])
+
+    assert loaded_numeric.numeric_list.dtype == np.float64
+    assert [loaded_numeric(i) for i in (3, 16)] == [3, 16.5]
+    assert [loaded_bool(i) for i in range(21)] == [i % 3 == 0 for i in range(21)]
+    assert loaded_tensor.ten.dtype == torch.int32
+    assert loaded_tensor.ten[:, 0].tolist() == list(range(21))
+
+
+def test_chunks_cut_on_exact_budget(tmp_path, small_build):
+    small_build("exact")
+
+    chunks = helpers.iterate_directory(tmp_path / "ProjectDatasets" / "exact", 0)
+    counts = [int(chunk.split("-")[-1].split(".")[0]) for chunk in chunks]
+
+    # 1_000 bytes a sample, a chunk is closed by the sample that crosses 100_000 bytes
+    assert sorted(counts) == [50, 100, 100]
+
+
+def test_parallel_build_numbers_chunks(tmp_path, small_build):
+    count = small_build("par", num_workers=2)
+
+    folder = tmp_path / "ProjectDatasets" / "par"
+    with open(folder / "manifest.json") as f:
+        manifest = json.load(f)
+
+    assert count == 250
+    assert [c["number"] for c in manifest["chunks"]] == [0, 1, 2, 3]
+    assert [c["sample_count"] for c in manifest["chunks"]] == [100, 25, 100, 25]
+    assert sorted(helpers.iterate_directory(folder, 0)) == sorted(
+        str(folder / c["file"]) for c in manifest["chunks"]
+    )
+
+
+def test_chunk_compressor_bounds_pending(tmp_path):
+    with helpers._ChunkCompressor(max_pending=2) as compressor:
+        for i in range(5):
+            chunk = tmp_path / f"dataset-{i}"
+            chunk.mkdir()
+            (chunk / "ann.json").write_text("[]")
+            compressor.submit(str(chunk), str(tmp_path / f"dataset-{i}-0.tar.gz"))
+            assert len(compressor._pending) <= 2
+
+    assert sorted(os.listdir(tmp_path)) == [f"dataset-{i}-0.tar.gz" for i in range(5)]
+
+
+class FailingProcessor(FixedSizeProcessor):
+    def __init__(self, fail_after):
+        super().__init__()
+        self.fail_after = fail_after
+        self.calls = 0
+
+    def _get_data(self, idx: int):
+        self.calls += 1
+        if self.calls > self.fail_after:
+            raise RuntimeError("interrupted")
+        super()._get_data(idx)
+
+
+def test_build_resumes_and_appends(tmp_path, small_build):
+    folder = tmp_path / "ProjectDatasets" / "resume"
+
+    try:
+        small_build("resume", dataset=FailingProcessor(fail_after=180))
+    except RuntimeError:
+        pass
+
+    done = helpers.read_manifest(folder)["chunks"]
+    assert [(c["start"], c["end"]) for c in done] == [(0, 100)]
+
+    assert small_build("resume", resume=True) == 250
+    first_chunk = (folder / "dataset-0-100.tar.gz").read_bytes()
+
+    assert small_build("resume", 300, resume=True) == 300
+
+    manifest = helpers.read_manifest(folder)
+    ranges = [(c["number"], c["start"], c["end"]) for c in manifest["chunks"]]
+    assert ranges == [(0, 0, 100), (1, 100, 200), (2, 200, 250), (3, 250, 300)]
+    assert (folder / "dataset-0-100.tar.gz").read_bytes() == first_chunk
+    segments = [(s["start"], s["stop"]) for s in manifest["segments"]]
+    assert segments == [(0, 250), (250, 300)]
+
+
+def test_append_batch_matches_append(tmp_path):
+    rng = np.random.default_rng(0)
+    ragged = [rng.random(rng.integers(1, 4, size=2)) for _ in range(5)]
+    values = {
+        "text": ["one", "twö\n", "", "four"],
+        "bool": [bool(i % 3) for i in range(21)],
+        "enforced": rng.random((6, 3)),
+        "ragged": ragged,
+        "torch": [torch.arange(4) + i for i in range(5)],
+        "num": np.arange(7, dtype=np.int16),
+    }
+
+    def make():
+        return {
+            "text": TextFile(),
+            "bool": BooleanFile(),
+            "enforced": NumpyFile(enforce_shape=True, shape=(3,)),
+            "ragged": NumpyFile(enforce_shape=False),
+            "torch": TorchFile(shape=(4,)),
+            "num": NumericFile(),
+        }
+
+    files = {}
+    for mode in ("single", "batch"):
+        (tmp_path / mode).mkdir()
+        for key, saver in make().items():
+            saver.prefix = str(tmp_path / mode)
+            if mode == "single":
+                for item in values[key]:
+                    saver.append(item)
+            else:
+                saver.append_batch(values[key][:2])
+                saver.append_batch(values[key][2:])
+            files[mode, key] = saver.save()[0]
+
+    for key in values:
+        single, batch = (
+            (tmp_path / mode / files[mode, key]).read_bytes()
+            for mode in ("single", "batch")
+        )
+        assert single == batch, key
+
+
+class BatchedProcessor(FixedSizeProcessor):
+    def _get_batch(self, indices: list[int]):
+        self.np1.append_batch(np.repeat(np.array(indices, float)[:, None], 125, 1))
+
+
+def test_batched_build_keeps_chunk_budget(tmp_path, small_build):
+    dataset = BatchedProcessor()
+    dataset.batch_size = 32
+    small_build("batched", dataset=dataset)
+
+    manifest = helpers.read_manifest(tmp_path / "ProjectDatasets" / "batched")
+    assert [c["sample_count"] for c in manifest["chunks"]] == [100, 100, 50]
+
+
+def test_tar_chunks_read_in_place(tmp_path, small_build):
+    small_build("in-place", chunk_format="tar")
+    small_build("gzipped")
+
+    for name in ("in-place", "gzipped"):
+        chunker = IterableChunk()
+        chunker.test_init(name, 250)
+
+        samples = []
+        for sample in chunker:
+            samples.append(float(sample[0]))
+            # only the compressed chunks are unpacked to a temporary folder
+            unpacked = any(i.startswith("Temp-") for i in os.listdir(tmp_path))
+            assert unpacked == (name == "gzipped")
+
+        assert samples == list(range(250))
+
+
+def test_prefetch_bounds_fetched_chunks(tmp_path, small_build):
+    small_build("prefetched")
+
+    def temp_folders():
+        return [i for i in os.listdir(tmp_path) if i.startswith("Temp-")]
+
+    for prefetch in (0, 2):
+        chunker = IterableChunk()
+        chunker.prefetch = prefetch
+        chunker.test_init("prefetched", 250)
+
+        samples = []
+        for sample in chunker:
+            samples.append(float(sample[0]))
+            # the chunk being read and the ones fetched ahead of it
+            assert len(temp_folders()) <= prefetch + 1
+
+        assert samples == list(range(250))
+        assert not temp_folders()
+
+    # stopping early drops the chunks that were fetched ahead
+    chunker = IterableChunk()
+    chunker.prefetch = 3
+    chunker.test_init("prefetched", 250)
+
+    iterator = iter(chunker)
+    next(iterator)
+    iterator.close()
+
+    assert not temp_folders()
+
+
+def test_chunk_aligned_worker_sharding(monkeypatch, small_build):
+    small_build("sharded", 1_000)
+    downloads = fake_cloud(monkeypatch, os.path.join("ProjectDatasets", "sharded"))
+
+    chunk_lists = []
+    get_ds_chunks = datasets.get_ds_chunks
+    monkeypatch.setattr(
+        datasets, "get_ds_chunks", lambda x: chunk_lists.append(x) or get_ds_chunks(x)
+    )
+
+    for sharding, num_workers in (("samples", 3), ("bytes", 4)):
+        downloads.clear()
+        chunk_lists.clear()
+
+        chunker = cloud_chunker(1_000)
+        chunker.sharding = sharding
+        chunker.chunk_index = chunker._load_chunk_index()
+
+        samples = []
+        for worker_id in range(num_workers):
+            worker = copy.deepcopy(chunker)
+            monkeypatch.setattr(
+                torch.utils.data,
+                "get_worker_info",
+                lambda: SimpleNamespace(dataset=worker, num_workers=num_workers),
+            )
+            IterableChunk.worker_init_fn(worker_id)
+
+            samples.extend(float(i[0]) for i in worker)
+
+        # every chunk is downloaded by one worker, from a single chunk list
+        assert sorted(samples) == list(range(1_000))
+        assert sorted(downloads, key=int) == [str(i) for i in range(10)]
+        assert len(chunk_lists) == 1
+
+
+def test_shuffled_streaming(tmp_path, monkeypatch, small_build):
+    small_build("shuffled", 1_000)
+
+    chunker = IterableChunk()
+    chunker.shuffle = True
+    chunker.shuffle_chunks = 3
+    chunker.prefetch = 2
+    chunker.test_init("shuffled", 1_000)
+
+    epochs = [[int(i[0]) for i in chunker] for _ in range(2)]
+
+    assert sorted(epochs[0]) == sorted(epochs[1]) == list(range(1_000))
+    assert epochs[0] != epochs[1]
+    # the first samples mix rows of several chunks
+    assert len({i // 100 for i in epochs[0][:50]}) > 1
+
+    chunker.set_epoch(0)
+    assert [int(i[0]) for i in chunker] == epochs[0]
+    assert not [i for i in os.listdir(tmp_path) if i.startswith("Temp-")]
+
+    # workers share the chunk order, and still read every sample once
+    samples = []
+    for worker_id in range(3):
+        worker = copy.deepcopy(chunker)
+        monkeypatch.setattr(
+            torch.utils.data,
+            "get_worker_info",
+            lambda: SimpleNamespace(dataset=worker, num_workers=3),
+        )
+        IterableChunk.worker_init_fn(worker_id)
+
+        samples.extend(int(i[0]) for i in worker)
+
+    assert sorted(samples) == list(range(1_000))
+
+
+def test_rank_aware_sharding(monkeypatch, small_build):
+    small_build("ranked", 1_000)
+
+    samples = []
+    for rank in range(3):
+        # every rank of a distributed run builds its own dataset
+        ranked = IterableChunk()
+        ranked.shuffle = True
+        ranked.test_init("ranked", 1_000)
+        ranked.length = 1_000
+        ranked.set_rank(rank, 3)
+        assert len(ranked) == 333
+
+        worker_lengths = []
+        for worker_id in range(2):
+            worker = copy.deepcopy(ranked)
+            monkeypatch.setattr(
+                torch.utils.data,
+                "get_worker_info",
+                lambda: SimpleNamespace(dataset=worker, num_workers=2),
+            )
+            IterableChunk.worker_init_fn(worker_id)
+
+            worker_samples = [int(i[0]) for i in worker]
+            worker_lengths.append(len(worker_samples))
+            samples.extend(worker_samples)
+
+        # every rank batches the same number of samples in each worker
+        assert worker_lengths == [167, 166]
+
+    assert len(samples) == len(set(samples)) == 999
+
+    with pytest.raises(ValueError):
+        ranked.set_rank(3, 3)
+
+
+def test_dataloader_workers_advance_epochs(monkeypatch, small_build):
+    small_build("epochs", 1_000)
+    monkeypatch.setattr(
+        datasets,
+        "get_current_dataset",
+        lambda name: {"id": name, "sample_count": 1_000},
+    )
+
+    chunker = IterableChunk()
+    chunker.shuffle = True
+    loader = helpers.get_local_dataloader(chunker, "epochs", 50, num_workers=2)
+
+    epochs = [
+        [int(i) for batch in loader for i in batch[:, 0].tolist()] for _ in range(2)
+    ]
+
+    assert sorted(epochs[0]) == sorted(epochs[1]) == list(range(1_000))
+    assert epochs[0] != epochs[1]
+
+
+def test_rank_and_worker_sharding_downloads(monkeypatch, small_build):
+    # appending to a build leaves chunks of 100, 100, 50, 100 and 50 samples
+    small_build("ranked")
+    small_build("ranked", 400, resume=True)
+    downloads = fake_cloud(monkeypatch, os.path.join("ProjectDatasets", "ranked"))
+
+    samples = []
+    for rank in range(2):
+        ranked = cloud_chunker(400)
+        ranked.sharding = "samples"
+        ranked.set_rank(rank, 2)
+
+        worker_lengths = []
+        for worker_id in range(2):
+            worker = copy.deepcopy(ranked)
+            monkeypatch.setattr(
+                torch.utils.data,
+                "get_worker_info",
+                lambda: SimpleNamespace(dataset=worker, num_workers=2),
+            )
+            IterableChunk.worker_init_fn(worker_id)
+
+            worker_samples = [int(i[0]) for i in worker]
+            worker_lengths.append(len(worker_samples))
+            samples.extend(worker_samples)
+
+        assert worker_lengths == [100, 100]
+
+    # workers of a rank are handed whole chunks, no chunk is downloaded twice
+    assert sorted(samples) == list(range(400))
+    assert sorted(downloads, key=int) == [str(i) for i in range(5)]
+
+
+def test_chunk_sharding_with_fewer_chunks_than_workers(monkeypatch, small_build):
+    small_build("single", 50)
+
+    chunker = IterableChunk()
+    assert chunker.sharding == "range"
+    chunker.sharding = "samples"
+    chunker.test_init("single", 50)
+
+    # a single chunk is cut into even runs of samples instead of idling workers
+    worker_samples = []
+    for worker_id in range(4):
+        worker = copy.deepcopy(chunker)
+        monkeypatch.setattr(
+            torch.utils.data,
+            "get_worker_info",
+            lambda: SimpleNamespace(dataset=worker, num_workers=4),
+        )
+        IterableChunk.worker_init_fn(worker_id)
+
+        worker_samples.append([int(i[0]) for i in worker])
+
+    assert [len(samples) for samples in worker_samples] == [13, 13, 12, 12]
+    assert sum(worker_samples, []) == list(range(50))
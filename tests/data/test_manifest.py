@@ -0,0 +1,53 @@
+import os
+
+import pytest
+
+from benchkit.data import helpers
+from benchkit.data.manifest import balanced_split
+from benchkit.data.manifest import ChunkIndex
+from benchkit.data.manifest import file_checksum
+from benchkit.data.manifest import slice_pieces
+
+
+def test_manifest_indexes_chunks(tmp_path, small_build):
+    small_build("indexed")
+    folder = tmp_path / "ProjectDatasets" / "indexed"
+
+    for chunk in helpers.read_manifest(folder)["chunks"]:
+        path = folder / chunk["file"]
+        assert chunk["size"] == os.path.getsize(path)
+        assert chunk["checksum"] == file_checksum(str(path))
+        assert chunk["tags"] == ["enforced_arr"]
+
+    index = ChunkIndex.from_folder(str(folder))
+    assert index.sample_count == 250
+    assert [index.locate(i) for i in (0, 99, 100, 249)] == [
+        (0, 0),
+        (0, 99),
+        (1, 0),
+        (2, 49),
+    ]
+    assert index.sample_range(1) == (100, 200)
+
+    # chunks of an interrupted build are not numbered yet
+    manifest = helpers.read_manifest(folder)
+    for chunk in manifest["chunks"]:
+        chunk["number"] = None
+    helpers._write_manifest(str(folder), manifest)
+
+    with pytest.raises(RuntimeError, match="--resume"):
+        ChunkIndex.from_folder(str(folder))
+
+
+def test_balanced_split():
+    index = ChunkIndex(["a", "b", "c"], [100, 100, 100], [10, 10, 80])
+    pieces = index.pieces(0, 300)
+
+    assert balanced_split([index.weight(i) for i in pieces], 2) == [0, 1, 3]
+    assert balanced_split([index.weight(i, "bytes") for i in pieces], 2) == [0, 2, 3]
+    assert balanced_split([index.weight(i) for i in pieces], 4) == [0, 1, 1, 2, 3]
+
+    pieces = index.pieces(50, 300)
+    assert pieces == [(0, 50, 100), (1, 100, 200), (2, 200, 300)]
+    assert balanced_split([index.weight(i) for i in pieces], 2) == [0, 2, 3]
+    assert slice_pieces(pieces, 30, 160) == [(0, 80, 100), (1, 100, 200), (2, 200, 210)]
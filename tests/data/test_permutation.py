@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+
+from benchkit.data.permutation import BlockPermutation
+from benchkit.data.permutation import IndexPermutation
+from tests.data.builds import FixedSizeProcessor
+
+
+def test_processing_orderings():
+    dataset = FixedSizeProcessor(length=10)
+
+    dataset.ordering = "sequential"
+    assert list(dataset.order()) == list(range(10))
+
+    dataset.ordering = "block"
+    dataset.block_size = 4
+    dataset.seed = 3
+    order = dataset.order()
+    runs = np.split(order, np.flatnonzero(np.diff(order) != 1) + 1)
+    assert sorted(map(list, runs)) == [[0, 1, 2, 3], [4, 5, 6, 7], [8, 9]]
+
+    dataset.ordering = "shuffle"
+    assert list(dataset.order()) == list(dataset.order())
+    assert sorted(dataset.order(5)) == [5, 6, 7, 8, 9]
+
+    with pytest.raises(ValueError):
+        dataset.ordering = "random"
+
+
+def test_index_permutation():
+    order = np.asarray(IndexPermutation(1_000, seed=1, offset=10))
+    assert sorted(order) == list(range(10, 1_010))
+    assert list(IndexPermutation(1_000, seed=1, offset=10)) == list(order)
+
+    permutation = IndexPermutation(3_000_000_000, seed=7)
+    shard = permutation[1_000_000_000:2_000_000_000]
+    first = next(iter(shard))
+    assert len(shard) == 1_000_000_000
+    assert first == permutation[1_000_000_000]
+    assert permutation.index(first) == 1_000_000_000
+
+    blocks = BlockPermutation(10, block_size=4, seed=2)
+    assert sorted(blocks) == list(range(10))
+    assert [blocks.index(i) for i in blocks] == list(range(10))
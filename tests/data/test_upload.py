@@ -0,0 +1,56 @@
+import json
+import os
+import shutil
+from types import SimpleNamespace
+
+from benchkit.data import helpers
+
+
+def test_upload_skips_known_chunk_content(tmp_path, monkeypatch, small_build):
+    posted = []
+
+    def get_post_url(dataset_id, size, file_name, *args):
+        posted.append(file_name)
+        return SimpleNamespace(content=b'{"url": "", "fields": {}}')
+
+    monkeypatch.setattr(
+        helpers, "get_current_dataset", lambda _: {"id": "ds", "sample_count": 250}
+    )
+    monkeypatch.setattr(helpers, "get_chunk_count", lambda _: 0)
+    monkeypatch.setattr(helpers, "get_post_url", get_post_url)
+    monkeypatch.setattr(helpers, "upload_using_presigned_url", lambda *args: None)
+
+    hash_index = helpers.LocalChunkHashIndex(str(tmp_path / "hashes.json"))
+
+    for _ in range(2):
+        # rebuilt from scratch, without a seed
+        shutil.rmtree(os.path.join("ProjectDatasets", "nightly"), ignore_errors=True)
+        small_build("nightly")
+        helpers.run_upload("nightly", hash_index)
+
+    # the second build holds the same samples in the same order
+    assert posted == [
+        "dataset-0-100.tar.gz",
+        "dataset-1-100.tar.gz",
+        "dataset-2-50.tar.gz",
+    ]
+
+    with open(tmp_path / "hashes.json") as f:
+        assert all(
+            files == [name] for name, files in zip(posted, json.load(f).values())
+        )
+
+    # the build is kept for the next one to resume unless deletion is asked for
+    save_folder = os.path.join("ProjectDatasets", "nightly")
+    assert os.path.isfile(os.path.join(save_folder, "manifest.json"))
+
+    helpers.run_upload("nightly", hash_index, delete_build=True)
+    assert not os.path.exists(save_folder)
+
+    # a chunk is never matched with an upload of another format
+    chunk = tmp_path / "chunk"
+    chunk.mkdir()
+    (chunk / "ann.json").write_text("[]")
+    assert helpers.chunk_digest(str(chunk), "tar") != helpers.chunk_digest(
+        str(chunk), "tar.gz"
+    )
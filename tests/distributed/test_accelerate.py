@@ -0,0 +1,81 @@
+import torch
+from accelerate.data_loader import DataLoaderShard
+from torch.utils.data import DataLoader
+from torch.utils.data import TensorDataset
+
+from benchkit.data import IterableChunk
+from benchkit.distributed.accelerate import helpers
+
+
+def chunk_loader() -> DataLoader:
+    chunker = IterableChunk()
+    chunker.length = 100
+
+    return DataLoader(chunker, batch_size=10)
+
+
+def spy_preparation(monkeypatch) -> list:
+    """
+    Records the arguments IterableChunk loaders are prepared with, and the ranks
+    their datasets are set to
+    """
+    calls = []
+    prepare_data_loader = helpers.prepare_data_loader
+    set_rank = IterableChunk.set_rank
+
+    def spy_prepare(dataloader, *args, **kwargs):
+        calls.append(("prepare", dataloader.dataset, kwargs))
+        return prepare_data_loader(dataloader, *args, **kwargs)
+
+    def spy_set_rank(self, rank, num_ranks):
+        calls.append(("set_rank", self, rank, num_ranks))
+        set_rank(self, rank, num_ranks)
+
+    monkeypatch.setattr(helpers, "prepare_data_loader", spy_prepare)
+    monkeypatch.setattr(IterableChunk, "set_rank", spy_set_rank)
+
+    return calls
+
+
+def test_bench_accelerator_prepares_chunk_loaders(monkeypatch):
+    calls = spy_preparation(monkeypatch)
+
+    model = torch.nn.Linear(4, 1)
+    chunks = chunk_loader()
+    tensors = DataLoader(TensorDataset(torch.zeros(20, 4)), batch_size=5)
+
+    acc, *prepared = helpers.get_bench_accelerator(model, chunks, tensors)
+
+    # prepared objects come back in the order they were passed
+    assert len(prepared) == 3
+    assert isinstance(prepared[0], torch.nn.Module)
+    assert prepared[1].dataset is chunks.dataset
+    assert isinstance(prepared[1], DataLoaderShard)
+    assert isinstance(prepared[2], DataLoaderShard)
+    assert prepared[2].dataset is tensors.dataset
+
+    # only the chunk loader skips dispatching, its dataset shards itself
+    assert calls == [
+        ("set_rank", chunks.dataset, acc.process_index, acc.num_processes),
+        (
+            "prepare",
+            chunks.dataset,
+            {
+                "num_processes": 1,
+                "process_index": 0,
+                "put_on_device": acc.device_placement,
+                "dispatch_batches": False,
+            },
+        ),
+    ]
+
+
+def test_bench_accelerator_with_only_chunk_loaders(monkeypatch):
+    calls = spy_preparation(monkeypatch)
+    chunks = chunk_loader()
+
+    acc, prepared = helpers.get_bench_accelerator(chunks)
+
+    assert prepared.dataset is chunks.dataset
+    assert [call[0] for call in calls] == ["set_rank", "prepare"]
+    assert calls[1][2]["dispatch_batches"] is False